@@ -0,0 +1,67 @@
+import os
+import hashlib
+from File_links import link_file
+
+class BlobStore:
+    def __init__(self, root='.blob_store', link_mode='hardlink'):
+        # Guarda cada imagem uma única vez, com o nome igual ao sha256 do conteúdo. Os datasets apontam
+        # para os blobs com hardlink (ou reflink), então a mesma imagem em vários projetos ocupa espaço uma vez
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.link_mode = link_mode
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1024 * 1024):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def blob_path(self, digest):
+        # Separa em subpastas pelos 2 primeiros caracteres para não ter milhões de arquivos numa pasta só
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def contains(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def add_file(self, path, digest=None):
+        # Registra o arquivo no store. Se o conteúdo já existir, o arquivo vira um link para o blob
+        # existente (e o espaço duplicado é liberado). Retorna o digest
+        digest = digest or self.file_hash(path)
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)  # O próprio arquivo vira o blob, sem copiar
+                return digest
+            except FileExistsError:
+                pass  # Outra thread registrou o mesmo conteúdo ao mesmo tempo
+            except OSError:
+                link_file(path, blob, 'copy')  # Store em outro disco
+                return digest
+
+        if not self.same_file(path, blob):
+            self.materialize(digest, path)
+        return digest
+
+    @staticmethod
+    def same_file(path_a, path_b):
+        try:
+            return os.path.samefile(path_a, path_b)
+        except OSError:
+            return False
+
+    def materialize(self, digest, dest):
+        # Cria dest apontando para o blob, trocando o arquivo atomicamente se dest já existir
+        tmp = dest + '.blob-tmp'
+        mode = link_file(self.blob_path(digest), tmp, self.link_mode)
+        os.replace(tmp, dest)
+        return mode
+
+    def store_file(self, src, dest, digest=None):
+        # Equivalente a copiar src para dest, mas escrevendo o conteúdo no store no máximo uma vez
+        digest = self.add_file(src, digest)
+        self.materialize(digest, dest)
+        return digest
@@ -1,11 +1,24 @@
 import shutil
 import uuid
+import os
 from pathlib import Path
 import json
+import hashlib
+import numpy as np
+import threading
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from File_links import link_file, LINK_MODES
+from Dataset_registry import DatasetRegistry
 
 
 class DatasetConcatenator:
-    def __init__(self, project_ids, output_dir, final_project_name='Dataset_concatenado', dataset_dir='.'):
+    MANIFEST_NAME = 'concat_manifest.json'
+
+    def __init__(self, project_ids, output_dir, final_project_name='Dataset_concatenado', dataset_dir='.',
+                 blob_store=None, link_mode='hardlink', workers=8, virtual=False, existing_dataset=None,
+                 registry=None):
         # Diretório onde os datasets estão
         self.dataset_dir = Path(dataset_dir)
         # Lista de IDs de projetos que vão ser concatenados
@@ -16,11 +29,31 @@ class DatasetConcatenator:
         self.final_project_name = final_project_name
         # Cria um nome único com UUID baseado nos IDs
         ids = "_".join(str(id) for id in self.project_ids)
-        self.output_dataset_path = self.output_dir / f'{self.final_project_name}_{ids}_{uuid.uuid4().hex[:5]}'
+        # Modo virtual: só metadados, listas de imagens e data.yaml apontando para os projetos de origem
+        self.virtual = virtual
+        suffix = '_virtual' if virtual else ''
+        self.output_dataset_path = self.output_dir / f'{self.final_project_name}_{ids}{suffix}_{uuid.uuid4().hex[:5]}'
+        # Dataset concatenado já existente: concatenate() só acrescenta/atualiza o que mudou nele
+        if existing_dataset is not None:
+            self.output_dataset_path = Path(existing_dataset)
+        self.manifest_path = self.output_dataset_path / self.MANIFEST_NAME
         # Define os diretórios padrão de split
         self.splits = ['train', 'val', 'test']
         # Flag para saber se o diretório foi realmente criado
         self.output_dataset_path_created = False
+        # BlobStore opcional: as imagens viram links para o store em vez de cópias
+        self.blob_store = blob_store
+        # Como as imagens entram no dataset novo: hardlink, reflink, symlink ou copy.
+        # As labels são sempre copiadas porque os IDs das classes são reescritos nelas
+        if link_mode not in LINK_MODES:
+            raise ValueError(f'Modo de link inválido: {link_mode}. Use um de {LINK_MODES}')
+        self.link_mode = link_mode
+        self.link_stats = Counter()  # Quantas imagens entraram por cada modo
+        self.workers = workers  # Quantos pares (projeto, split) são processados ao mesmo tempo
+        self.lock = threading.Lock()
+        self.merged_classes = []  # Classes finais, preenchidas por merge_metadata_files
+        # Registro dos datasets: acha os projetos pelo ID e recebe o dataset concatenado no final
+        self.registry = registry or DatasetRegistry(dataset_dir)
 
     def create_dirs(self):
         try:
@@ -34,27 +67,92 @@ class DatasetConcatenator:
             print(f"[ERRO] Falha ao criar diretórios: {e}")
 
     def find_project_path(self, project_id):
-        # Busca o caminho da pasta de um projeto com base no ID final do nome da pasta
-        for folder in self.dataset_dir.iterdir():
-            if folder.is_dir() and folder.name.endswith(f'_{project_id}'):
-                return folder  # Retorna o caminho se encontrado
+        # Busca a pasta do projeto no registro de datasets (ID exato)
+        path = self.registry.find_project(project_id)
+        if path is not None:
+            return Path(path)
 
         # Caso não encontre loga um aviso
         warning = f'Pasta do projeto {project_id} não encontrada!'
         print(f'[AVISO] {warning}')
         return None
 
-    def copy_data(self, images, labels, des_images, des_labels, project_id):
-        # Copia os arquivos de imagem e label renomeando com o ID
+    def known_digests(self, project_path):
+        # Lê os sha256 do manifesto de download do projeto, para não precisar reler as imagens para o store
+        manifest_file = project_path / 'download_manifest.json'
+        if not manifest_file.exists():
+            return {}
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('tasks', {})
+        except Exception:
+            return {}
+        return {e['filename']: (e.get('size'), e.get('sha256')) for e in entries.values() if e.get('sha256')}
+
+    def place_image(self, img_file, dest, digests=None):
+        # Coloca a imagem no dataset novo (link, cópia ou blob store) e retorna o modo usado
+        if self.blob_store is None:
+            return link_file(img_file, dest, self.link_mode)
+
+        # Só aproveita o hash do manifesto se o arquivo ainda tiver o mesmo tamanho
+        size, digest = (digests or {}).get(img_file.name, (None, None))
+        if digest and size != os.path.getsize(img_file):
+            digest = None
+        self.blob_store.store_file(str(img_file), str(dest), digest)
+        return 'blob_store'
+
+    @staticmethod
+    def remap_labels(label_files, destinations, remap):
+        # Lê cada label de origem uma vez, troca os IDs de todas as linhas de uma vez com o array remap
+        # (classe antiga -> classe nova, -1 sem mapeamento) e escreve cada label uma vez no destino.
+        # Linhas com classe sem mapeamento são descartadas. Retorna o sha256 de cada label de origem
+        rows = []
+        counts = []
+        digests = []
+        for label_file in label_files:
+            with open(label_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+            digests.append(hashlib.sha256(text.encode('utf-8')).hexdigest())
+            file_rows = [parts for parts in (line.split() for line in text.splitlines()) if parts]
+            rows.extend(file_rows)
+            counts.append(len(file_rows))
+
+        old = np.array([parts[0] for parts in rows], dtype=np.int64)
+        new = np.full(len(old), -1, dtype=np.int64)
+        known = (old >= 0) & (old < len(remap))
+        new[known] = remap[old[known]]
+
+        start = 0
+        for dest, count in zip(destinations, counts):
+            lines = [' '.join([str(new_class)] + parts[1:])
+                     for new_class, parts in zip(new[start:start + count].tolist(), rows[start:start + count])
+                     if new_class >= 0]
+            with open(dest, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+            start += count
+        return digests
+
+    def copy_data(self, images, labels, des_images, des_labels, project_id, remap, digests=None):
+        # Copia os arquivos de imagem e label renomeando com o ID; as labels já saem com as classes remapeadas
+        stats = Counter()
         for img_file in images.glob('*.*'):
             new_name = f'{project_id}_{img_file.name}'
-            shutil.copy2(img_file, des_images / new_name)
+            stats[self.place_image(img_file, des_images / new_name, digests)] += 1
 
+        label_files = []
         for lb_file in labels.glob('*.*'):
-            new_name = f'{project_id}_{lb_file.name}'
-            shutil.copy2(lb_file, des_labels / new_name)
+            if lb_file.suffix == '.txt':
+                label_files.append(lb_file)
+            else:
+                shutil.copy2(lb_file, des_labels / f'{project_id}_{lb_file.name}')
+        digests = self.remap_labels(label_files, [des_labels / f'{project_id}_{f.name}' for f in label_files], remap)
+
+        with self.lock:
+            self.link_stats.update(stats)
+        # Hash de cada label copiada, por caminho relativo ao projeto, para o manifesto da concatenação
+        return {f'labels/{labels.name}/{f.name}': digest for f, digest in zip(label_files, digests)}
 
-    def split_process(self, project_path, split, project_id):
+    def split_process(self, project_path, split, project_id, remap, digests=None):
         # Define os caminhos de origem e destino para cada split (train, test, val)
         images = project_path / 'images' / split
         labels = project_path / 'labels' / split
@@ -63,35 +161,96 @@ class DatasetConcatenator:
 
         # Se existirem os diretórios de origem faz a cópia
         if images.exists() and labels.exists():
-            self.copy_data(images, labels, des_images, des_labels, project_id)
+            return self.copy_data(images, labels, des_images, des_labels, project_id, remap, digests)
+        return {}
     
-    def merge_metadata_files(self, ids_validos):
-        merged_classes = []
-        class_mapping = {}
-        normalized_class_map = {} # Mapeia o nome original
-        class_index_counter = 0
+    @staticmethod
+    def labels_within(label_files, n_classes):
+        # Confere se todas as labels só usam IDs de classe válidos (0..n_classes-1), ou seja,
+        # se podem ser usadas sem remapeamento
+        for label_file in label_files:
+            with open(label_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split(None, 1)
+                    if parts and not 0 <= int(parts[0]) < n_classes:
+                        return False
+        return True
+
+    def virtual_split_process(self, project_path, split, project_id, remap):
+        # Retorna os caminhos das imagens do split para as listas do data.yaml, sem copiar nada.
+        # Projetos cujas classes não mudam de ID são usados direto da origem (com as labels originais);
+        # os demais ganham na pasta do dataset virtual só symlinks das imagens e as labels remapeadas
+        images = project_path / 'images' / split
+        labels = project_path / 'labels' / split
+        if not (images.exists() and labels.exists()):
+            return []
+
+        image_files = sorted(images.glob('*.*'))
+        label_files = sorted(labels.glob('*.txt'))
+        if np.array_equal(remap, np.arange(len(remap))) and self.labels_within(label_files, len(remap)):
+            return [os.path.abspath(f) for f in image_files]
+
+        des_images = self.output_dataset_path / 'images' / split
+        des_labels = self.output_dataset_path / 'labels' / split
+        paths = []
+        for img_file in image_files:
+            dest = des_images / f'{project_id}_{img_file.name}'
+            link_file(img_file, dest, 'symlink')
+            paths.append(os.path.abspath(dest))
+
+        self.remap_labels(label_files, [des_labels / f'{project_id}_{f.name}' for f in label_files], remap)
+        with self.lock:
+            self.link_stats['symlink'] += len(image_files)
+        return paths
+
+    def write_virtual_files(self, image_lists):
+        # Escreve uma lista de imagens por split e o data.yaml de treino apontando para elas
+        for split in self.splits:
+            with open(self.output_dataset_path / f'{split}.txt', 'w', encoding='utf-8') as f:
+                for path in image_lists[split]:
+                    f.write(path + '\n')
+
+        # Strings JSON também são YAML válido, então os nomes saem escapados corretamente
+        names = ', '.join(json.dumps(name, ensure_ascii=False) for name in self.merged_classes)
+        with open(self.output_dataset_path / 'data.yaml', 'w', encoding='utf-8') as f:
+            f.write(f'path: {json.dumps(os.path.abspath(self.output_dataset_path), ensure_ascii=False)}\n')
+            for split in self.splits:
+                f.write(f'{split}: {split}.txt\n')
+            f.write(f'nc: {len(self.merged_classes)}\n')
+            f.write(f'names: [{names}]\n')
+
+    def merge_metadata_files(self, ids_validos, base_classes=None):
+        # Junta as classes de todos os projetos, escreve classes.txt e notes.json e retorna, por projeto,
+        # um array denso classe antiga -> classe nova (-1 para classes sem nome) usado ao copiar as labels.
+        # base_classes são as classes de uma concatenação anterior: mantêm seus índices e as novas vão para o fim
+        merged_classes = list(base_classes or [])
+        remaps = {}
+        # Nome normalizado -> índice no classes.txt final
+        normalized_class_map = {}
+        for idx, cls in enumerate(merged_classes):
+            normalized_class_map.setdefault(cls.strip().lower(), idx)
         final_info = None  # Armazena apenas um bloco "info" (do primeiro projeto)
 
         for project_id, project_path in ids_validos:
+            remaps[project_id] = np.full(0, -1, dtype=np.int64)
+
             # Lê classes.txt
             classes_file = project_path / 'classes.txt'
             if classes_file.exists():
                 with open(classes_file, 'r', encoding='utf-8') as f:
                     classes = [line.strip() for line in f.readlines()]
 
+                remap = np.full(len(classes), -1, dtype=np.int64)
                 for idx, cls in enumerate(classes):
                     normalized = cls.strip().lower()
-                    if normalized not in normalized_class_map:
-                        # Primeira vez que a categoria aparece
-                        normalized_class_map[normalized] = cls # Salva o nome original
+                    new_idx = normalized_class_map.get(normalized)
+                    if new_idx is None:
+                        # Primeira vez que a categoria aparece (mantém o nome original)
+                        new_idx = len(merged_classes)
+                        normalized_class_map[normalized] = new_idx
                         merged_classes.append(cls)
-                        class_mapping[(project_id, idx)] = class_index_counter
-                        class_index_counter += 1
-                    else:
-                        # A categoria ja existente
-                        existing_cls = normalized_class_map[normalized]
-                        new_idx = merged_classes.index(existing_cls)
-                        class_mapping[(project_id, idx)] = new_idx
+                    remap[idx] = new_idx
+                remaps[project_id] = remap
 
             # Lê notes.json pra extrair "info" (uma vez só)
             notes_file = project_path / 'notes.json'
@@ -104,30 +263,6 @@ class DatasetConcatenator:
                         "contributor": "Label Studio"
                     })
 
-        # Atualiza os arquivos de label com os índices novos
-        for split in self.splits:
-            labels_dir = self.output_dataset_path / 'labels' / split
-            for label_file in labels_dir.glob('*.txt'):
-                project_id_str = label_file.name.split('_')[0]
-                try:
-                    project_id = int(project_id_str)
-                except ValueError:
-                    continue
-                updated_lines = []
-                with open(label_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        parts = line.strip().split()
-                        if not parts:
-                            continue
-                        old_class = int(parts[0])
-                        new_class = class_mapping.get((project_id, old_class))
-                        if new_class is None:
-                            continue
-                        parts[0] = str(new_class)
-                        updated_lines.append(' '.join(parts))
-                with open(label_file, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(updated_lines))
-
         # Escreve o novo classes.txt
         with open(self.output_dataset_path / 'classes.txt', 'w', encoding='utf-8') as f:
             for cls in merged_classes:
@@ -146,9 +281,179 @@ class DatasetConcatenator:
         with open(self.output_dataset_path / 'notes.json', 'w', encoding='utf-8') as f:
             json.dump(final_notes, f, indent=4, ensure_ascii=False)
 
+        self.merged_classes = merged_classes
         print("[LOG] Metadados mesclados com sucesso.")
+        return remaps
+
+    def scan_project(self, project_path):
+        # Tamanho e mtime de cada imagem/label dos splits do projeto, por caminho relativo (ex: images/train/a.jpg)
+        files = {}
+        for split in self.splits:
+            if not ((project_path / 'images' / split).exists() and (project_path / 'labels' / split).exists()):
+                continue
+            for kind in ('images', 'labels'):
+                with os.scandir(project_path / kind / split) as entries:
+                    for entry in entries:
+                        if entry.is_file() and '.' in entry.name:
+                            stat = entry.stat()
+                            files[f'{kind}/{split}/{entry.name}'] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        return files
+
+    def output_file(self, project_id, rel):
+        # Caminho no dataset concatenado do arquivo rel de um projeto
+        kind, split, name = rel.split('/')
+        return self.output_dataset_path / kind / split / f'{project_id}_{name}'
+
+    @staticmethod
+    def label_digest(label_file):
+        # Mesmo hash que remap_labels registra para a label de origem
+        with open(label_file, 'r', encoding='utf-8') as f:
+            return hashlib.sha256(f.read().encode('utf-8')).hexdigest()
+
+    def load_manifest(self):
+        # Manifesto da concatenação: projetos de origem, mapa de classes e estado de cada arquivo copiado
+        if not self.manifest_path.exists():
+            return None
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[AVISO] Manifesto da concatenação inválido, ignorado: {e}")
+            return None
+
+    def save_manifest(self, sources):
+        # Salva num temporário e renomeia, para não corromper o manifesto se o processo cair no meio
+        manifest = {
+            'merged_classes': self.merged_classes,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'sources': sources
+        }
+        tmp_path = str(self.manifest_path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def source_entry(project_path, remap, files, label_digests, image_digests):
+        # Entrada de um projeto no manifesto; as imagens usam o sha256 do manifesto de download quando o tamanho bate
+        for rel, info in files.items():
+            if rel in label_digests:
+                info['sha256'] = label_digests[rel]
+            elif rel.startswith('images/'):
+                size, digest = image_digests.get(rel.rsplit('/', 1)[1], (None, None))
+                if digest and size == info['size']:
+                    info['sha256'] = digest
+        return {'path': os.path.abspath(project_path), 'remap': remap.tolist(), 'files': files}
+
+    def sync_project(self, project_id, project_path, remap, previous=None):
+        # Aplica no dataset concatenado só a diferença entre o projeto agora e o que está no manifesto.
+        # Um arquivo é refeito se for novo ou se tamanho/mtime e hash mudaram; as labels também são refeitas
+        # quando o mapa de classes do projeto mudou. Retorna a nova entrada do manifesto e as contagens
+        previous = previous or {}
+        old_files = previous.get('files', {})
+        remap_changed = previous.get('remap') != remap.tolist()
+        files = self.scan_project(project_path)
+        image_digests = self.known_digests(project_path)
+        stats = Counter()
+
+        # Arquivos que sumiram da origem saem do dataset
+        for rel in old_files:
+            if rel not in files:
+                self.output_file(project_id, rel).unlink(missing_ok=True)
+                stats['removidos'] += 1
+
+        label_files = []
+        label_digests = {}
+        for rel, info in files.items():
+            old = old_files.get(rel)
+            same_stat = old is not None and old['size'] == info['size'] and old['mtime_ns'] == info['mtime_ns']
+            source = project_path / rel
+            dest = self.output_file(project_id, rel)
+
+            if rel.startswith('images/'):
+                size, digest = image_digests.get(source.name, (None, None))
+                same_hash = old is not None and digest is not None and size == info['size'] \
+                    and old.get('sha256') == digest
+                if same_stat or same_hash:
+                    stats['mantidos'] += 1
+                    continue
+                stats[self.place_image(source, dest, image_digests)] += 1
+
+            elif rel.endswith('.txt'):
+                if same_stat and not remap_changed:
+                    label_digests[rel] = old.get('sha256')
+                    stats['mantidos'] += 1
+                    continue
+                if old is not None and not remap_changed:
+                    digest = self.label_digest(source)
+                    if digest == old.get('sha256'):
+                        label_digests[rel] = digest
+                        stats['mantidos'] += 1
+                        continue
+                label_files.append(rel)
+
+            elif not same_stat:
+                shutil.copy2(source, dest)
+
+        digests = self.remap_labels([project_path / rel for rel in label_files],
+                                    [self.output_file(project_id, rel) for rel in label_files], remap)
+        label_digests.update(zip(label_files, digests))
+        stats['labels'] += len(label_files)
+
+        with self.lock:
+            self.link_stats.update(stats)
+        return self.source_entry(project_path, remap, files, label_digests, image_digests)
+
+    def update(self):
+        # Atualiza um dataset concatenado existente: acrescenta os projetos novos de project_ids e, em todos os
+        # projetos do manifesto, copia e remapeia só o que mudou. Os índices das classes já existentes não mudam
+        manifest = self.load_manifest()
+        if manifest is None:
+            print(f'\n[ERRO] {self.output_dataset_path} não tem manifesto de concatenação')
+            return None
+        sources = manifest.get('sources', {})
+
+        ids_validos = []
+        ids_invalidos = []
+        for id in dict.fromkeys([int(id) for id in sources] + [int(id) for id in self.project_ids]):
+            recorded = sources.get(str(id), {}).get('path')
+            project_path = Path(recorded) if recorded and Path(recorded).is_dir() else self.find_project_path(id)
+            if project_path is None:
+                ids_invalidos.append(id)
+            else:
+                ids_validos.append((id, project_path))
+
+        # Projetos sem pasta continuam no dataset como estavam
+        if ids_invalidos:
+            print(f'\n[AVISO] Projetos não encontrados, mantidos como estavam: {ids_invalidos}')
+
+        print(f'\n[OK] Atualizando {self.output_dataset_path} com os projetos: {[id for id, _ in ids_validos]}')
+
+        try:
+            self.create_dirs()
+            remaps = self.merge_metadata_files(ids_validos, base_classes=manifest.get('merged_classes'))
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [(id, executor.submit(self.sync_project, id, project_path, remaps[id], sources.get(str(id))))
+                           for id, project_path in ids_validos]
+                for id, future in futures:
+                    sources[str(id)] = future.result()
+
+            self.save_manifest(sources)
+            self.registry.register_concatenation(self.output_dataset_path, [int(id) for id in sources])
+            print(f'[OK] Atualização finalizada com sucesso: {self.output_dataset_path}')
+            print(f'[INFO] Arquivos por situação: {dict(self.link_stats)}')
+            return self.output_dataset_path
+
+        except Exception as e:
+            print(f"[ERRO] Falha na atualização: {e}")
+            return None
 
     def concatenate(self):
+        # Dataset já concatenado antes (com manifesto): só a diferença é aplicada
+        if self.manifest_path.exists():
+            return self.update()
+
         # Listas para guardar os IDs válidos e inválidos
         ids_validos = []
         ids_invalidos = []
@@ -178,14 +483,46 @@ class DatasetConcatenator:
         try:
             self.create_dirs()  # Cria os diretórios de destino
 
-            # Para cada ID válido, processa seus splits (train, val, test)
-            for id, project_path in ids_validos:
-                for split in self.splits:
-                    self.split_process(project_path, split, id)
+            # O mapeamento das classes vem primeiro, assim cada label é lida e escrita uma única vez
+            remaps = self.merge_metadata_files(ids_validos)
+
+            # Para cada ID válido, processa seus splits (train, val, test) em paralelo
+            # O estado dos arquivos é lido antes da cópia: o que mudar durante a cópia é refeito na próxima atualização
+            scans = {} if self.virtual else {id: self.scan_project(project_path) for id, project_path in ids_validos}
+            project_digests = {id: self.known_digests(project_path) for id, project_path in ids_validos}
+
+            image_lists = {split: [] for split in self.splits}
+            label_digests = {id: {} for id, _ in ids_validos}
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = []
+                for id, project_path in ids_validos:
+                    for split in self.splits:
+                        if self.virtual:
+                            future = executor.submit(self.virtual_split_process, project_path, split, id, remaps[id])
+                        else:
+                            future = executor.submit(self.split_process, project_path, split, id,
+                                                     remaps[id], project_digests[id])
+                        futures.append((id, split, future))
+                for id, split, future in futures:
+                    result = future.result()
+                    if self.virtual:
+                        image_lists[split].extend(result)
+                    else:
+                        label_digests[id].update(result)
+
+            if self.virtual:
+                self.write_virtual_files(image_lists)
+            else:
+                # Manifesto para as próximas atualizações copiarem só a diferença
+                self.save_manifest({str(id): self.source_entry(project_path, remaps[id], scans[id],
+                                                               label_digests[id], project_digests[id])
+                                    for id, project_path in ids_validos})
 
             # Registra o sucesso
+            self.registry.register_concatenation(self.output_dataset_path, [id for id, _ in ids_validos],
+                                                 virtual=self.virtual)
             print(f'[OK] Concatenação finalizada com sucesso: {self.output_dataset_path}')
-            self.merge_metadata_files(ids_validos)
+            print(f'[INFO] Imagens por modo: {dict(self.link_stats)}')
             return self.output_dataset_path
 
         except Exception as e:
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import hashlib
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from Image_probe import probe_sizes
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class DatasetIndex:
+    def __init__(self, dataset_path, project_id=None, workers=8, filename='dataset_index.db', hash_files=False):
+        # Índice (SQLite) dos arquivos de um dataset: caminho, split, projeto de origem, tamanho, mtime, hash,
+        # largura/altura e quantas anotações de cada classe a imagem tem. É montado uma vez em paralelo e depois
+        # só os arquivos com tamanho/mtime diferentes são relidos
+        self.dataset_path = dataset_path
+        self.images_dir = os.path.join(dataset_path, 'images')
+        self.labels_dir = os.path.join(dataset_path, 'labels')
+        # Projeto de origem de todas as imagens; sem ele o projeto vem do prefixo do nome (<id>_arquivo)
+        self.project_id = project_id
+        self.workers = workers
+        # Calcula o sha256 de cada imagem já no refresh; sem ele o hash só é calculado por content_hashes,
+        # para as imagens que precisam comparar conteúdo (ex: hardlinks de duplicatas)
+        self.hash_files = hash_files
+        self.db_path = os.path.join(dataset_path, filename)
+        self.create_tables()
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_tables(self):
+        with self.connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY,
+                                split TEXT,
+                                project_id INTEGER,
+                                size INTEGER,
+                                mtime_ns INTEGER,
+                                label_mtime_ns INTEGER,
+                                sha256 TEXT,
+                                width INTEGER,
+                                height INTEGER)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS class_counts (
+                                path TEXT NOT NULL,
+                                class_id INTEGER NOT NULL,
+                                count INTEGER NOT NULL,
+                                PRIMARY KEY (path, class_id))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS perceptual_hashes (
+                                path TEXT PRIMARY KEY,
+                                mtime_ns INTEGER,
+                                dhash INTEGER)""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_split ON files (split)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_resolution ON files (width, height)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_class_counts_class ON class_counts (class_id)')
+
+    def label_path(self, rel):
+        return os.path.join(self.labels_dir, os.path.splitext(rel)[0] + '.txt')
+
+    def scan(self):
+        # Tamanho e mtime de cada imagem (e o mtime da sua label), por caminho relativo a images/ (ex: train/a.jpg)
+        current = {}
+        for root, _, files in os.walk(self.images_dir):
+            for name in files:
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.images_dir).replace(os.sep, '/')
+                stat = os.stat(path)
+                try:
+                    label_mtime = os.stat(self.label_path(rel)).st_mtime_ns
+                except OSError:
+                    label_mtime = None
+                current[rel] = (stat.st_size, stat.st_mtime_ns, label_mtime)
+        return current
+
+    @staticmethod
+    def file_hash(path, chunk_size=1024 * 1024):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def project_of(self, rel):
+        if self.project_id is not None:
+            return int(self.project_id)
+        prefix = rel.rsplit('/', 1)[-1].split('_', 1)[0]
+        return int(prefix) if prefix.isdigit() else None
+
+    def describe(self, rel, stat, dimensions):
+        # Linha do índice e contagem de classes de uma imagem, com a (largura, altura) já lida do cabeçalho
+        path = os.path.join(self.images_dir, rel)
+        size, mtime_ns, label_mtime = stat
+        width, height = dimensions
+        sha256 = self.file_hash(path) if self.hash_files else None
+        split = rel.split('/')[0] if '/' in rel else ''
+
+        classes = Counter()
+        if label_mtime is not None:
+            with open(self.label_path(rel), 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split(None, 1)
+                    if parts and parts[0].lstrip('-').isdigit():
+                        classes[int(parts[0])] += 1
+
+        row = (rel, split, self.project_of(rel), size, mtime_ns, label_mtime, sha256, width, height)
+        return row, [(rel, class_id, count) for class_id, count in classes.items()]
+
+    def refresh(self):
+        # Atualiza o índice: relê em paralelo só as imagens novas ou alteradas e apaga as que sumiram
+        current = self.scan()
+        with self.connect() as conn:
+            known = {path: (size, mtime_ns, label_mtime)
+                     for path, size, mtime_ns, label_mtime
+                     in conn.execute('SELECT path, size, mtime_ns, label_mtime_ns FROM files')}
+
+        changed = [rel for rel, stat in current.items() if known.get(rel) != stat]
+        removed = [(rel,) for rel in known if rel not in current]
+
+        # Só o cabeçalho de cada imagem é lido (decodifica apenas se ele não puder ser lido)
+        dimensions = probe_sizes([os.path.join(self.images_dir, rel) for rel in changed], workers=self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda item: self.describe(item[0], current[item[0]], item[1]),
+                                        zip(changed, dimensions)))
+
+        with self.connect() as conn:
+            conn.executemany('DELETE FROM files WHERE path = ?', removed)
+            conn.executemany('DELETE FROM perceptual_hashes WHERE path = ?', removed)
+            conn.executemany('DELETE FROM class_counts WHERE path = ?', removed + [(rel,) for rel in changed])
+            conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             [row for row, _ in results])
+            conn.executemany('INSERT INTO class_counts VALUES (?, ?, ?)',
+                             [count for _, counts in results for count in counts])
+
+        if changed or removed:
+            print(f"[INFO] Índice do dataset atualizado: {len(changed)} imagens lidas, {len(removed)} removidas, "
+                  f"{len(current) - len(changed)} sem mudança")
+        return self
+
+    def absolute(self, rel):
+        return os.path.join(self.images_dir, *rel.split('/'))
+
+    def images(self, split=None, width=None, height=None):
+        # Caminhos das imagens indexadas, opcionalmente de um split e/ou de uma resolução
+        query = 'SELECT path FROM files WHERE 1 = 1'
+        params = []
+        if split is not None:
+            query += ' AND split = ?'
+            params.append(split)
+        if width is not None and height is not None:
+            query += ' AND width = ? AND height = ?'
+            params.extend([width, height])
+        with self.connect() as conn:
+            return [self.absolute(rel) for (rel,) in conn.execute(query + ' ORDER BY path', params)]
+
+    def resolutions(self):
+        # (largura, altura) -> quantidade de imagens, das mais comuns para as menos
+        with self.connect() as conn:
+            rows = conn.execute('SELECT width, height, COUNT(*) FROM files WHERE width IS NOT NULL '
+                                'GROUP BY width, height ORDER BY COUNT(*) DESC').fetchall()
+        return {(width, height): count for width, height, count in rows}
+
+    def unreadable(self):
+        # Imagens cujo tamanho não pôde ser lido
+        with self.connect() as conn:
+            return [self.absolute(rel) for (rel,) in conn.execute('SELECT path FROM files WHERE width IS NULL')]
+
+    def sizes(self):
+        # Caminho -> (largura, altura) das imagens legíveis
+        with self.connect() as conn:
+            rows = conn.execute('SELECT path, width, height FROM files WHERE width IS NOT NULL ORDER BY path')
+            return {self.absolute(rel): (width, height) for rel, width, height in rows}
+
+    def counts_by_project(self):
+        # split -> {projeto: quantidade de imagens}. Imagens sem ID numérico no nome contam pelo prefixo do nome
+        # (o que vem antes do primeiro '_'), como nos relatórios por pasta
+        counts = {}
+        with self.connect() as conn:
+            for split, project_id, count in conn.execute('SELECT split, project_id, COUNT(*) FROM files '
+                                                         'WHERE project_id IS NOT NULL GROUP BY split, project_id'):
+                counts.setdefault(split, {})[project_id] = count
+            for split, rel in conn.execute('SELECT split, path FROM files WHERE project_id IS NULL'):
+                prefix = rel.rsplit('/', 1)[-1].split('_', 1)[0]
+                split_counts = counts.setdefault(split, {})
+                split_counts[prefix] = split_counts.get(prefix, 0) + 1
+        return counts
+
+    def class_histogram(self, split=None):
+        # ID da classe -> total de anotações (e de imagens com a classe)
+        query = ('SELECT c.class_id, SUM(c.count), COUNT(*) FROM class_counts c JOIN files f ON f.path = c.path')
+        params = []
+        if split is not None:
+            query += ' WHERE f.split = ?'
+            params.append(split)
+        with self.connect() as conn:
+            return {class_id: (total, images)
+                    for class_id, total, images in conn.execute(query + ' GROUP BY c.class_id', params)}
+
+    def entries(self):
+        # (caminho relativo, split, mtime, sha256) de cada imagem indexada; sha256 é None se ainda não foi calculado
+        with self.connect() as conn:
+            return conn.execute('SELECT path, split, mtime_ns, sha256 FROM files ORDER BY path').fetchall()
+
+    def content_hashes(self, rels):
+        # Caminho relativo -> sha256 das imagens pedidas. Os que faltam são calculados agora, em paralelo, e ficam
+        # no índice até a imagem mudar; None se a imagem não estiver no índice ou não puder ser lida
+        rels = list(dict.fromkeys(rels))
+        hashes = {}
+        with self.connect() as conn:
+            for start in range(0, len(rels), 500):  # Limite de parâmetros por consulta do SQLite
+                batch = rels[start:start + 500]
+                marks = ','.join('?' * len(batch))
+                hashes.update(conn.execute(f'SELECT path, sha256 FROM files WHERE path IN ({marks})', batch))
+
+        def read_hash(rel):
+            try:
+                return self.file_hash(self.absolute(rel))
+            except OSError:
+                return None
+
+        missing = [rel for rel, sha256 in hashes.items() if sha256 is None]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            computed = list(executor.map(read_hash, missing))
+        with self.connect() as conn:
+            conn.executemany('UPDATE files SET sha256 = ? WHERE path = ?',
+                             [(sha256, rel) for rel, sha256 in zip(missing, computed) if sha256 is not None])
+        hashes.update(zip(missing, computed))
+        return {rel: hashes.get(rel) for rel in rels}
+
+    def cached_hashes(self):
+        # Hashes perceptuais já calculados: caminho -> (mtime da imagem quando foi calculado, hash)
+        with self.connect() as conn:
+            return {path: (mtime_ns, dhash) for path, mtime_ns, dhash
+                    in conn.execute('SELECT path, mtime_ns, dhash FROM perceptual_hashes')}
+
+    def save_hashes(self, rows):
+        # rows: (caminho relativo, mtime, hash com sinal de 64 bits)
+        with self.connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?, ?)', rows)
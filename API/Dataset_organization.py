@@ -1,80 +1,275 @@
 import os
+import json
+import errno
 import shutil
 import random
+import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 class DataOrganizer:
-    def __init__(self, dataset_dir, image_exists=None, split_ratios=None):
+    def __init__(self, dataset_dir, image_exists=None, split_ratios=None, seed=42, workers=8):
         self.dataset_dir = dataset_dir
         self.images_dir = os.path.join(dataset_dir, 'images')  # Pasta das imagens
         self.labels_dir = os.path.join(dataset_dir, 'labels')  # Pasta dos labels
         self.image_exists = image_exists if image_exists else ['.jpg', '.jpeg', '.png']  # Extensões válidas
         self.txt = '.txt'  # Extensão dos labels
         self.split_ratios = split_ratios if split_ratios else {'train': 0.8, 'val': 0.1, 'test': 0.1}  # Proporções
+        self.seed = seed  # Semente da divisão, para a mesma entrada gerar sempre os mesmos splits
+        self.workers = workers  # Threads usadas para mover os arquivos
+        self.manifest_path = os.path.join(dataset_dir, 'split_manifest.json')  # Registro do split de cada imagem
+        # Texto das labels já lidas por get_image_files (nome sem extensão -> texto), reaproveitado no histograma
+        self.label_texts = {}
 
         print(f"[INFO] Inicializando DataOrganizer no diretório: {self.dataset_dir}")
 
     def start_split(self):
         try:
+            self.sync_existing_split()  # Reexportação: labels novas acompanham imagens que já têm split
+
             print(f"[INFO] Lendo imagens em: {self.images_dir}")
             image_files = self.get_image_files()  # Pega arquivos de imagem válidos
             print(f"[INFO] Encontradas {len(image_files)} imagens")
 
+            # Imagens que já estão no manifesto voltam para o mesmo split, só as novas são divididas
+            known = self.load_manifest()
+            new_files = [f for f in image_files if f not in known]
+
             print("[INFO] Dividindo dataset")
-            train, val, test = self.split_data(image_files)  # Divide o dataset
+            histogram = self.class_histogram((f, self.read_label(Path(f).stem)) for f in new_files)
+            train, val, test = self.split_data(new_files, histogram)  # Divide o dataset
 
             print("[INFO] Criando pastas")
             self.create_folders()  # Cria as pastas necessárias
 
+            assignment = {f: known[f] for f in image_files if f in known}
+            for subset, files in (('train', train), ('val', val), ('test', test)):
+                assignment.update(dict.fromkeys(files, subset))
+
             print("[INFO] Movendo arquivos")
-            self.move_data(train, 'train')
-            self.move_data(val, 'val')
-            self.move_data(test, 'test')
+            self.move_assignment(assignment)
+            self.save_manifest(assignment)
 
             print("[INFO] Organização concluída!")
 
         except Exception as e:
             print(f"[ERRO] DataOrganizer.start_split: {e}")
+            raise
+
+    def load_manifest(self):
+        # Lê o split registrado de cada imagem ({arquivo: split})
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except Exception as e:
+            print(f"[AVISO] Manifesto de split inválido, ignorado: {e}")
+            return {}
+
+    def save_manifest(self, assignment):
+        # Junta as novas atribuições com as já registradas e salva
+        files = self.load_manifest()
+        files.update(assignment)
+        manifest = {'seed': self.seed, 'ratios': self.split_ratios, 'files': files}
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def reapply_split(self):
+        # Reaplica o split registrado no manifesto sem listar as pastas nem dividir de novo:
+        # move para o split de cada arquivo o que estiver em images/ e labels/
+        assignment = self.load_manifest()
+        if not assignment:
+            print("[AVISO] Nenhum manifesto de split encontrado")
+            return
+        self.create_folders()
+        self.move_assignment(assignment)
+        print(f"[INFO] Split reaplicado a partir de {self.manifest_path}")
+
+    def current_split_files(self):
+        # Mapeia cada imagem que já está em images/<split> para o split dela
+        files = {}
+        for subset in self.split_ratios:
+            subset_dir = os.path.join(self.images_dir, subset)
+            if os.path.isdir(subset_dir):
+                for f in os.listdir(subset_dir):
+                    files[f] = subset
+        return files
+
+    def existing_split(self):
+        # Mesmo mapa, pelo nome sem extensão
+        return {Path(f).stem: subset for f, subset in self.current_split_files().items()}
+
+    def read_label(self, stem):
+        if stem in self.label_texts:
+            return self.label_texts[stem]
+        with open(os.path.join(self.labels_dir, stem + self.txt), 'r') as lbl_file:
+            return lbl_file.read()
+
+    def build_assignment(self, stems, read_label=None):
+        # Define o split de cada nome: quem já está num split continua nele, os novos são divididos.
+        # read_label(nome) retorna o texto da label (padrão: lê de labels/), usado na estratificação
+        assignment = {Path(f).stem: subset for f, subset in self.load_manifest().items()}
+        assignment.update(self.existing_split())
+        new_stems = [stem for stem in stems if stem not in assignment]
+        histogram = self.class_histogram((stem, (read_label or self.read_label)(stem)) for stem in new_stems)
+        train, val, test = self.split_data(new_stems, histogram)
+        for subset, subset_stems in (('train', train), ('val', val), ('test', test)):
+            for stem in subset_stems:
+                assignment[stem] = subset
+        return {stem: assignment[stem] for stem in stems}
+
+    def sync_existing_split(self):
+        # Numa reexportação as imagens já divididas continuam no split delas e só as labels são extraídas de novo
+        # em labels/. Move cada label para o mesmo split da imagem, para não misturar splits nem perder a atualização
+        try:
+            stem_split = self.existing_split()
+            if not stem_split or not os.path.isdir(self.labels_dir):
+                return
+
+            moved = 0
+            for f in os.listdir(self.labels_dir):
+                subset = stem_split.get(Path(f).stem)
+                if subset and f.endswith(self.txt):
+                    os.makedirs(os.path.join(self.labels_dir, subset), exist_ok=True)
+                    os.replace(os.path.join(self.labels_dir, f), os.path.join(self.labels_dir, subset, f))
+                    moved += 1
+
+            if moved:
+                print(f"[INFO] {moved} labels atualizadas nos splits existentes")
+        except Exception as e:
+            print(f"[ERRO] DataOrganizer.sync_existing_split: {e}")
+
+    def scan_labels(self):
+        # Uma passada por scandir em labels/: nome (sem extensão) -> tamanho do arquivo
+        labels = {}
+        if not os.path.isdir(self.labels_dir):
+            return labels
+        with os.scandir(self.labels_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.txt) and entry.is_file():
+                    labels[entry.name[:-len(self.txt)]] = entry.stat().st_size
+        return labels
+
+    def load_label_texts(self, stems):
+        # Lê cada label uma vez só, em paralelo; o texto serve para achar as vazias e depois para o histograma
+        def read(stem):
+            with open(os.path.join(self.labels_dir, stem + self.txt), 'r') as lbl_file:
+                return lbl_file.read()
+
+        stems = list(stems)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.label_texts.update(zip(stems, executor.map(read, stems)))
 
     def get_image_files(self):
         try:
-            files = []
-            for f in os.listdir(self.images_dir):
-                if Path(f).suffix.lower() in self.image_exists:
-                    label_filename = Path(f).stem + self.txt
-                    label_path = os.path.join(self.labels_dir, label_filename)
-
-                    if os.path.exists(label_path):
-                        with open(label_path, 'r') as lbl_file:
-                            content = lbl_file.read().strip()
-
-                        if content:
-                            files.append(f)
-                        else:
-                            os.remove(label_path)
-                            os.remove(os.path.join(self.images_dir, f))
-                            print(f'[AVISO] Removido label vazio e imagem associada: {f}')
-                    else:
-                        print(f'[AVISO] Imagem sem label: {f} — ignorada.')
-
-            print(f"[DEBUG] Arquivos válidos: {files}")
+            # Indexa images/ e labels/ com uma passada cada, e o pareamento vira operação de conjuntos
+            images = []
+            with os.scandir(self.images_dir) as entries:
+                for entry in entries:
+                    suffix = Path(entry.name).suffix
+                    if suffix.lower() in self.image_exists and entry.is_file():
+                        images.append((entry.name[:-len(suffix)], entry.name))
+
+            labels = self.scan_labels()
+            image_stems = {stem for stem, _ in images}
+            paired = image_stems & labels.keys()
+            # Tamanho 0 já basta pelo scandir; as demais são lidas uma vez e vazias são as só com espaços
+            self.load_label_texts(stem for stem in paired if labels[stem] > 0)
+            empty = {stem for stem in paired if labels[stem] == 0 or not self.label_texts[stem].strip()}
+            valid = paired - empty
+
+            files = sorted(f for stem, f in images if stem in valid)
+            for stem, f in images:
+                if stem in empty:
+                    os.remove(os.path.join(self.images_dir, f))
+                elif stem not in labels:
+                    print(f'[AVISO] Imagem sem label: {f} — ignorada.')
+            for stem in empty:
+                os.remove(os.path.join(self.labels_dir, stem + self.txt))
+            if empty:
+                print(f'[AVISO] Removidos {len(empty)} labels vazios e imagens associadas')
+
             return files
         except Exception as e:
             print(f"[ERRO] DataOrganizer.get_image_files: {e}")
             return []
 
-    def split_data(self, files):
+    @staticmethod
+    def class_histogram(labels):
+        # Matriz (imagens x classes) com quantos objetos de cada classe há em cada label, montada de uma vez
+        # com bincount a partir da primeira coluna de todas as labels. labels: (nome, texto) de cada label.
+        # Linhas cuja primeira coluna não é um ID de classe são ignoradas e informadas
+        counts = []
+        class_ids = []
+        invalid = []
+        for name, text in labels:
+            ids = []
+            for number, line in enumerate(text.splitlines(), 1):
+                parts = line.split(None, 1)
+                if not parts:
+                    continue
+                if parts[0].isdigit():
+                    ids.append(int(parts[0]))
+                else:
+                    invalid.append((name, number, line.strip()))
+            counts.append(len(ids))
+            class_ids.extend(ids)
+
+        if invalid:
+            print(f"[AVISO] {len(invalid)} linhas de label inválidas ignoradas na divisão:")
+            for name, number, line in invalid[:20]:
+                print(f"[AVISO] {name}, linha {number}: {line[:80]}")
+            if len(invalid) > 20:
+                print(f"[AVISO] ... e mais {len(invalid) - 20}")
+
+        n_images = len(counts)
+        if not class_ids:
+            return np.zeros((n_images, 0), dtype=np.int64)
+        n_classes = max(class_ids) + 1
+        rows = np.repeat(np.arange(n_images), counts)
+        flat = np.bincount(rows * n_classes + np.asarray(class_ids), minlength=n_images * n_classes)
+        return flat.reshape(n_images, n_classes)
+
+    def split_data(self, files, histogram=None):
+        # Divide com semente fixa. Com o histograma de classes a divisão é estratificada: cada imagem entra no
+        # grupo da classe mais rara que contém e cada grupo é dividido nas proporções de train/val/test
         try:
-            random.shuffle(files)  # Embaralha arquivos
+            files = list(files)
             total = len(files)
-            n_train = int(self.split_ratios['train'] * total)
-            n_val = int(self.split_ratios['val'] * total)
+            rng = np.random.default_rng(self.seed)
+
+            if histogram is None or histogram.size == 0:
+                random.Random(self.seed).shuffle(files)  # Embaralha arquivos
+                n_train = int(self.split_ratios['train'] * total)
+                n_val = int(self.split_ratios['val'] * total)
+
+                train_set = files[:n_train]  # do início até n_train
+                val_set = files[n_train:n_train + n_val]  # do n_train até n_val
+                test_set = files[n_train + n_val:]  # o restante
+            else:
+                frequency = histogram.sum(axis=0)
+                present = histogram > 0
+                rarest = np.where(present, frequency, np.iinfo(np.int64).max).argmin(axis=1)
+                group = np.where(present.any(axis=1), rarest, -1)  # -1: imagens sem objetos
 
-            train_set = files[:n_train]  # do início até n_train
-            val_set = files[n_train:n_train + n_val]  # do n_train até n_val
-            test_set = files[n_train + n_val:]  # o restante 
+                # Ordena por grupo e, dentro do grupo, de forma aleatória (mas reproduzível)
+                order = np.lexsort((rng.random(total), group))
+                sorted_group = group[order]
+                group_start = np.searchsorted(sorted_group, sorted_group, side='left')
+                group_size = np.searchsorted(sorted_group, sorted_group, side='right') - group_start
+                position = (np.arange(total) - group_start + 0.5) / group_size
 
-            print(f"[DEBUG] Train: {len(train_set)}, Val: {len(val_set)}, Test: {len(test_set)}")
+                cumulative = np.cumsum([self.split_ratios['train'], self.split_ratios['val']])
+                subset = np.searchsorted(cumulative, position, side='right')  # 0 train, 1 val, 2 test
+
+                train_set = [files[i] for i in order[subset == 0]]
+                val_set = [files[i] for i in order[subset == 1]]
+                test_set = [files[i] for i in order[subset == 2]]
+
+            print(f"[INFO] Train: {len(train_set)}, Val: {len(val_set)}, Test: {len(test_set)}")
             return train_set, val_set, test_set
         except Exception as e:
             print(f"[ERRO] DataOrganizer.split_data: {e}")
@@ -86,27 +281,49 @@ class DataOrganizer:
             for folder in ['images/train', 'images/val', 'images/test',
                            'labels/train', 'labels/val', 'labels/test']:
                 os.makedirs(os.path.join(self.dataset_dir, folder), exist_ok=True)
-                print(f"[DEBUG] Pasta pronta: {folder}")
         except Exception as e:
             print(f"[ERRO] DataOrganizer.create_folders: {e}")
 
+    @staticmethod
+    def rename(paths):
+        # Move com rename (mesmo sistema de arquivos); só copia se estiver em outro disco
+        src, dst = paths
+        try:
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(src, dst)
+
+    def move_assignment(self, assignment):
+        # Move imagens ({arquivo: split}) e as labels delas em lote, em paralelo.
+        # Arquivos que não estão mais em images/ ou labels/ (já movidos) são ignorados
+        moves = []
+        for image_file, subset in assignment.items():
+            src_img = os.path.join(self.images_dir, image_file)
+            if os.path.exists(src_img):
+                moves.append((src_img, os.path.join(self.images_dir, subset, image_file)))
+
+            label_file = Path(image_file).stem + self.txt  # .stem retorna o nome do arquivo sem a extensão
+            src_lbl = os.path.join(self.labels_dir, label_file)
+            if os.path.exists(src_lbl):
+                moves.append((src_lbl, os.path.join(self.labels_dir, subset, label_file)))
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [(paths, executor.submit(self.rename, paths)) for paths in moves]
+            for paths, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append((paths[0], e))
+
+        for path, e in errors:
+            print(f"[ERRO] DataOrganizer.move_assignment: {path}: {e}")
+        print(f"[INFO] {len(moves) - len(errors)} arquivos movidos")
+
     def move_data(self, image_list, subset):
         try:
-            for image_file in image_list:
-                # Move imagem
-                src_img = os.path.join(self.images_dir, image_file)
-                dst_img = os.path.join(self.dataset_dir, 'images', subset, image_file)
-                shutil.move(src_img, dst_img)
-                print(f"[DEBUG] Imagem movida: {image_file}")
-
-                # Move label se existir
-                label_file = Path(image_file).stem + self.txt  # .stem retorna o nome do arquivo sem a extensão
-                src_lbl = os.path.join(self.labels_dir, label_file)
-                if os.path.exists(src_lbl):
-                    dst_lbl = os.path.join(self.dataset_dir, 'labels', subset, label_file)
-                    shutil.move(src_lbl, dst_lbl)
-                    print(f"[DEBUG] Label movido: {label_file}")
-                else:
-                    print(f"[AVISO] Label não encontrado: {label_file}")
+            self.move_assignment(dict.fromkeys(image_list, subset))
         except Exception as e:
             print(f"[ERRO] DataOrganizer.move_data: {e}")
@@ -0,0 +1,203 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+from contextlib import contextmanager
+
+class DatasetRegistry:
+    def __init__(self, base_path='.', filename='dataset_registry.db', concat_dir='Dataset_concatenado'):
+        # Registro persistente (SQLite) dos datasets exportados e concatenados: id, nome, caminho, projetos de
+        # origem, contagens e data de criação. As buscas por ID viram consultas indexadas em vez de varrer pastas
+        self.base_path = base_path  # Pasta onde ficam os datasets exportados
+        self.concat_dir = concat_dir  # Subpasta dos datasets concatenados
+        self.db_path = os.path.join(base_path, filename)
+        self.create_tables()
+
+    @contextmanager
+    def connect(self):
+        # Uma conexão por operação, para o registro poder ser usado pelas threads das etapas de exportação
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_tables(self):
+        with self.connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS datasets (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                kind TEXT NOT NULL,
+                                name TEXT,
+                                path TEXT NOT NULL UNIQUE,
+                                images INTEGER,
+                                labels INTEGER,
+                                created_at TEXT NOT NULL,
+                                updated_at TEXT NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS dataset_sources (
+                                dataset_id INTEGER NOT NULL,
+                                project_id INTEGER NOT NULL,
+                                PRIMARY KEY (dataset_id, project_id))""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sources_project ON dataset_sources (project_id, dataset_id)')
+            # Registros antigos de datasets virtuais feitos como concatenação passam para o tipo próprio
+            rows = conn.execute("SELECT id, path FROM datasets WHERE kind = 'concatenated'").fetchall()
+            conn.executemany("UPDATE datasets SET kind = 'virtual' WHERE id = ?",
+                             [(dataset_id,) for dataset_id, path in rows if self.is_virtual(path)])
+
+    @staticmethod
+    def count_files(path):
+        # Quantas imagens e labels o dataset tem (em images/ e labels/, com ou sem splits)
+        counts = []
+        for kind in ('images', 'labels'):
+            total = 0
+            for _, _, files in os.walk(os.path.join(path, kind)):
+                total += len(files)
+            counts.append(total)
+        return tuple(counts)
+
+    def register(self, kind, path, project_ids, name=None, counts=None, created_at=None):
+        # Cria ou atualiza a entrada do dataset (o caminho absoluto identifica o dataset)
+        path = os.path.abspath(path)
+        now = datetime.now().isoformat(timespec='seconds')
+        images, labels = counts if counts is not None else self.count_files(path)
+        with self.connect() as conn:
+            row = conn.execute('SELECT id FROM datasets WHERE path = ?', (path,)).fetchone()
+            if row:
+                dataset_id = row[0]
+                conn.execute('UPDATE datasets SET kind = ?, name = ?, images = ?, labels = ?, updated_at = ? '
+                             'WHERE id = ?', (kind, name, images, labels, now, dataset_id))
+                conn.execute('DELETE FROM dataset_sources WHERE dataset_id = ?', (dataset_id,))
+            else:
+                cursor = conn.execute('INSERT INTO datasets (kind, name, path, images, labels, created_at, updated_at) '
+                                      'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                      (kind, name, path, images, labels, created_at or now, now))
+                dataset_id = cursor.lastrowid
+            conn.executemany('INSERT OR IGNORE INTO dataset_sources (dataset_id, project_id) VALUES (?, ?)',
+                             [(dataset_id, int(project_id)) for project_id in project_ids])
+        return dataset_id
+
+    def register_project(self, project_id, path, name=None, counts=None):
+        return self.register('project', path, [project_id], name=name, counts=counts)
+
+    def register_concatenation(self, path, project_ids, name=None, counts=None, virtual=False):
+        # Datasets virtuais (só listas de imagens) ficam com tipo próprio e não entram na busca por IDs, que precisa
+        # de um dataset com as imagens na pasta
+        return self.register('virtual' if virtual else 'concatenated', path, project_ids,
+                             name=name or os.path.basename(path), counts=counts)
+
+    def remove(self, path):
+        with self.connect() as conn:
+            row = conn.execute('SELECT id FROM datasets WHERE path = ?', (os.path.abspath(path),)).fetchone()
+            if row:
+                conn.execute('DELETE FROM dataset_sources WHERE dataset_id = ?', (row[0],))
+                conn.execute('DELETE FROM datasets WHERE id = ?', (row[0],))
+
+    def first_existing(self, rows):
+        # Primeiro caminho que ainda existe; entradas de pastas apagadas saem do registro
+        for (path,) in rows:
+            if os.path.isdir(path):
+                return path
+            self.remove(path)
+        return None
+
+    def query_project(self, project_id):
+        with self.connect() as conn:
+            rows = conn.execute("""SELECT d.path FROM datasets d
+                                   JOIN dataset_sources s ON s.dataset_id = d.id
+                                   WHERE d.kind = 'project' AND s.project_id = ?
+                                   ORDER BY d.updated_at DESC""", (int(project_id),)).fetchall()
+        return self.first_existing(rows)
+
+    def query_concatenation(self, project_ids):
+        # Concatenações que contêm todos os projetos pedidos; a com menos projetos (a exata) e mais nova vem antes
+        project_ids = sorted({int(project_id) for project_id in project_ids})
+        marks = ', '.join('?' * len(project_ids))
+        with self.connect() as conn:
+            rows = conn.execute(f"""SELECT d.path FROM datasets d
+                                    JOIN dataset_sources s ON s.dataset_id = d.id
+                                    WHERE d.kind = 'concatenated' AND s.project_id IN ({marks})
+                                    GROUP BY d.id
+                                    HAVING COUNT(*) = ?
+                                    ORDER BY (SELECT COUNT(*) FROM dataset_sources x WHERE x.dataset_id = d.id),
+                                             d.updated_at DESC""", (*project_ids, len(project_ids))).fetchall()
+        return self.first_existing(rows)
+
+    def find_project(self, project_id):
+        # Pasta exportada do projeto (ID exato: 6 não encontra 60). Se não estiver registrada, as pastas são
+        # registradas uma vez a partir dos nomes e a busca é refeita
+        path = self.query_project(project_id)
+        if path is None:
+            self.scan()
+            path = self.query_project(project_id)
+        return path
+
+    def find_concatenation(self, project_ids):
+        path = self.query_concatenation(project_ids)
+        if path is None:
+            self.scan()
+            path = self.query_concatenation(project_ids)
+        return path
+
+    def sources(self, path):
+        # IDs dos projetos de origem de um dataset registrado
+        with self.connect() as conn:
+            rows = conn.execute("""SELECT s.project_id FROM dataset_sources s
+                                   JOIN datasets d ON d.id = s.dataset_id
+                                   WHERE d.path = ? ORDER BY s.project_id""", (os.path.abspath(path),)).fetchall()
+        return [project_id for (project_id,) in rows]
+
+    def project_paths(self, project_ids):
+        # ID do projeto -> pasta exportada, para os projetos pedidos que estiverem registrados
+        paths = {}
+        for project_id in project_ids:
+            path = self.query_project(project_id)
+            if path is not None:
+                paths[int(project_id)] = path
+        return paths
+
+    def registered_paths(self):
+        with self.connect() as conn:
+            return {path for (path,) in conn.execute('SELECT path FROM datasets')}
+
+    @staticmethod
+    def is_virtual(path):
+        # Pelo nome gerado pelo DatasetConcatenator: <nome>_<ids>_virtual_<sufixo>
+        return 'virtual' in os.path.basename(path).split('_')[:-1]
+
+    @staticmethod
+    def concatenation_sources(path):
+        # Projetos de uma concatenação: pelo manifesto ou, sem ele, pelos números do nome
+        # (o último pedaço do nome é o sufixo aleatório, mesmo quando só tem dígitos)
+        manifest_file = os.path.join(path, 'concat_manifest.json')
+        if os.path.exists(manifest_file):
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    return [int(project_id) for project_id in json.load(f).get('sources', {})]
+            except Exception:
+                pass
+        return [int(part) for part in os.path.basename(path).split('_')[:-1] if part.isdigit()]
+
+    def scan(self):
+        # Registra as pastas ainda não registradas, como fallback para datasets criados antes do registro:
+        # Dataset_<nome>_<id> na pasta base e as concatenações em Dataset_concatenado
+        known = self.registered_paths()
+
+        for entry in os.scandir(self.base_path):
+            if not entry.is_dir() or entry.name == self.concat_dir or os.path.abspath(entry.path) in known:
+                continue
+            parts = entry.name.split('_')
+            if len(parts) > 1 and parts[-1].isdigit():
+                name = '_'.join(parts[1:-1]) if parts[0] == 'Dataset' else '_'.join(parts[:-1])
+                created_at = datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds')
+                self.register('project', entry.path, [parts[-1]], name=name, created_at=created_at)
+
+        concat_path = os.path.join(self.base_path, self.concat_dir)
+        if os.path.isdir(concat_path):
+            for entry in os.scandir(concat_path):
+                if not entry.is_dir() or os.path.abspath(entry.path) in known:
+                    continue
+                project_ids = self.concatenation_sources(entry.path)
+                if project_ids:
+                    created_at = datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds')
+                    kind = 'virtual' if self.is_virtual(entry.path) else 'concatenated'
+                    self.register(kind, entry.path, project_ids, name=entry.name, created_at=created_at)
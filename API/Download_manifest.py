@@ -0,0 +1,61 @@
+import os
+import json
+import hashlib
+
+class DownloadManifest:
+    def __init__(self, dataset_dir, filename='download_manifest.json'):
+        self.dataset_dir = dataset_dir  # Pasta do dataset
+        self.path = os.path.join(dataset_dir, filename)  # Caminho do manifesto
+        self.entries = {}  # task id (str) -> dados da imagem baixada
+        self.load()
+
+    def load(self):
+        # Carrega o manifesto de uma exportação anterior, se existir
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('tasks', {})
+            print(f"[INFO] Manifesto de download carregado com {len(self.entries)} imagens")
+        except Exception as e:
+            print(f"[AVISO] Manifesto de download inválido, ignorado: {e}")
+            self.entries = {}
+
+    def save(self):
+        # Salva num temporário e renomeia, para não corromper o manifesto se o processo cair no meio
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'tasks': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, task_id):
+        return self.entries.get(str(task_id))
+
+    def update(self, task_id, entry):
+        self.entries[str(task_id)] = entry
+
+    def remove(self, task_id):
+        return self.entries.pop(str(task_id), None)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1024 * 1024):
+        # Calcula o sha256 do arquivo em blocos
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def is_valid(self, entry, url, path, verify_hash=False):
+        # A imagem local é válida se a URL não mudou e o arquivo tem o tamanho (e o hash) registrado
+        if not entry or entry.get('url') != url or path is None:
+            return False
+        try:
+            if os.path.getsize(path) != entry.get('size'):
+                return False
+        except OSError:
+            return False
+        if verify_hash:
+            return self.file_hash(path) == entry.get('sha256')
+        return True
@@ -0,0 +1,207 @@
+import os
+import cv2
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from File_links import link_file
+
+# Quantos bits 1 tem cada byte, para a distância de Hamming entre hashes de 64 bits
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+# Ordem de preferência da imagem mantida em cada grupo de duplicatas
+SPLIT_PRIORITY = {'train': 0, 'val': 1, 'test': 2}
+
+
+def dhash(path, hash_size=8):
+    # Hash de diferença (dHash) de 64 bits: a imagem reduzida a 9x8 em tons de cinza, cada bit diz se um pixel
+    # é mais claro que o vizinho da direita. A decodificação já sai reduzida pela metade (IMREAD_REDUCED_*)
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if img is None:
+        return None
+    small = cv2.resize(img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def hamming(a, b):
+    # Distância de Hamming elemento a elemento entre dois arrays uint64
+    x = np.bitwise_xor(a, b)
+    return POPCOUNT[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:  # Compressão de caminho
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class DuplicateFinder:
+    def __init__(self, index, max_distance=4, workers=8):
+        # Procura imagens quase iguais do dataset pelo hash perceptual (dHash), sem comparar todos os pares:
+        # os 64 bits são divididos em max_distance + 1 pedaços e, como dois hashes a até max_distance bits de
+        # distância têm pelo menos um pedaço idêntico, só são comparados os hashes que coincidem em algum pedaço
+        self.index = index  # DatasetIndex do dataset (lista das imagens e cache dos hashes)
+        self.max_distance = max_distance  # Maior distância de Hamming considerada duplicata
+        self.workers = workers
+
+    def compute_hashes(self, entries):
+        # Hash de cada imagem; só as novas ou alteradas (mtime diferente do cache) são decodificadas, em paralelo
+        cached = self.index.cached_hashes()
+        hashes = {}
+        pending = []
+        for rel, _, mtime_ns, _ in entries:
+            hit = cached.get(rel)
+            if hit and hit[0] == mtime_ns:
+                hashes[rel] = hit[1] & 0xFFFFFFFFFFFFFFFF  # SQLite guarda com sinal
+            else:
+                pending.append((rel, mtime_ns))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            computed = list(executor.map(lambda item: dhash(self.index.absolute(item[0])), pending))
+
+        rows = []
+        for (rel, mtime_ns), value in zip(pending, computed):
+            if value is None:
+                print(f"[ERRO] Falha ao ler: {self.index.absolute(rel)}")
+                continue
+            hashes[rel] = value
+            rows.append((rel, mtime_ns, value - (1 << 64) if value >= 1 << 63 else value))
+        self.index.save_hashes(rows)
+        if pending:
+            print(f"[INFO] {len(rows)} hashes calculados, {len(hashes) - len(rows)} reaproveitados do índice")
+        return hashes
+
+    def chunks(self):
+        # (deslocamento, máscara) de cada pedaço dos 64 bits
+        bounds = np.linspace(0, 64, self.max_distance + 2).astype(int)
+        return [(int(start), (1 << int(end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def similar_pairs(self, unique):
+        # Pares (i, j) de hashes distintos a até max_distance bits, comparando só quem divide um pedaço.
+        # Para cada pedaço os hashes são ordenados pelo valor do pedaço e cada um é comparado com os k seguintes
+        # enquanto ainda houver vizinhos com o mesmo valor, tudo vetorizado
+        pairs = set()
+        for shift, mask in self.chunks():
+            keys = (unique >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            values = unique[order]
+            k = 1
+            while k < len(keys):
+                same = keys[:-k] == keys[k:]
+                if not same.any():
+                    break
+                left = np.nonzero(same)[0]
+                close = hamming(values[left], values[left + k]) <= self.max_distance
+                for a, b in zip(order[left[close]].tolist(), order[left[close] + k].tolist()):
+                    pairs.add((min(a, b), max(a, b)))
+                k += 1
+        return pairs
+
+    def find_clusters(self):
+        # Grupos de imagens duplicadas: [(caminho relativo, split, sha256), ...], só grupos com 2 ou mais
+        entries = self.index.entries()
+        hashes = self.compute_hashes(entries)
+        entries = [entry for entry in entries if entry[0] in hashes]
+        if not entries:
+            return []
+
+        # Hashes idênticos já formam um grupo; a busca por vizinhos roda só sobre os hashes distintos
+        values = np.array([hashes[entry[0]] for entry in entries], dtype=np.uint64)
+        unique, inverse = np.unique(values, return_inverse=True)
+
+        groups = UnionFind(len(unique))
+        for a, b in self.similar_pairs(unique):
+            groups.union(a, b)
+
+        clusters = defaultdict(list)
+        for entry, u in zip(entries, inverse.tolist()):
+            clusters[groups.find(u)].append((entry[0], entry[1], entry[3]))
+        return [sorted(cluster, key=self.keep_order) for cluster in clusters.values() if len(cluster) > 1]
+
+    @staticmethod
+    def keep_order(entry):
+        # A primeira imagem do grupo é a mantida: prefere train, depois val, depois test
+        return SPLIT_PRIORITY.get(entry[1], len(SPLIT_PRIORITY)), entry[0]
+
+    @staticmethod
+    def leaking(clusters):
+        # Grupos com imagens em mais de um split (vazamento entre treino e validação/teste)
+        return [cluster for cluster in clusters if len({split for _, split, _ in cluster}) > 1]
+
+    def write_report(self, clusters, output_path):
+        leaks = self.leaking(clusters)
+        split_pairs = Counter()
+        for cluster in leaks:
+            splits = sorted({split for _, split, _ in cluster}, key=lambda s: SPLIT_PRIORITY.get(s, 3))
+            for i, a in enumerate(splits):
+                for b in splits[i + 1:]:
+                    split_pairs[f'{a} x {b}'] += 1
+
+        lines = [f"Distância máxima de Hamming: {self.max_distance}",
+                 f"Grupos de duplicatas: {len(clusters)}",
+                 f"Imagens duplicadas (além da mantida em cada grupo): {sum(len(c) - 1 for c in clusters)}",
+                 f"Grupos com vazamento entre splits: {len(leaks)}"]
+        for pair, count in sorted(split_pairs.items()):
+            lines.append(f" - {pair}: {count} grupos")
+        lines.append("")
+
+        lines.append("Vazamento entre splits:")
+        for cluster in leaks:
+            lines.append(f" Grupo ({len(cluster)} imagens):")
+            lines.extend(f"  [{split}] {rel}" for rel, split, _ in cluster)
+        lines.append("")
+
+        lines.append("Todos os grupos (a primeira imagem de cada grupo é a mantida):")
+        for cluster in clusters:
+            lines.append(f" Grupo ({len(cluster)} imagens):")
+            lines.extend(f"  [{split}] {rel}" for rel, split, _ in cluster)
+        lines.append("")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+        print(f"Relatório de duplicatas salvo em {output_path}")
+
+    def drop(self, clusters):
+        # Apaga todas as imagens (e labels) de cada grupo menos a mantida
+        removed = 0
+        for cluster in clusters:
+            for rel, _, _ in cluster[1:]:
+                os.remove(self.index.absolute(rel))
+                label = self.index.label_path(rel)
+                if os.path.exists(label):
+                    os.remove(label)
+                removed += 1
+        print(f"[OK] {removed} imagens duplicadas removidas")
+        return removed
+
+    def hardlink(self, clusters):
+        # Troca as cópias idênticas (mesmo sha256) da imagem mantida por hardlinks para ela, liberando espaço.
+        # Quase-duplicatas com conteúdo diferente continuam como estão, para não trocar a imagem das suas labels.
+        # O sha256 só é calculado aqui, e só para as imagens dos grupos
+        hashes = self.index.content_hashes(rel for cluster in clusters for rel, _, _ in cluster)
+        linked = 0
+        for cluster in clusters:
+            keep_rel = cluster[0][0]
+            keep_sha = hashes[keep_rel]
+            keep = self.index.absolute(keep_rel)
+            for rel, _, _ in cluster[1:]:
+                path = self.index.absolute(rel)
+                if keep_sha is None or hashes[rel] != keep_sha or os.path.samefile(keep, path):
+                    continue
+                link_file(keep, path, 'hardlink')
+                linked += 1
+        print(f"[OK] {linked} imagens idênticas trocadas por hardlinks")
+        return linked
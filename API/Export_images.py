@@ -1,15 +1,30 @@
 import os
-import requests
-from label_studio_sdk import Client
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from Http_session import stream_download, iter_tasks, CHUNK_SIZE
+from LabelStudio_client import LabelStudioClient
+from Download_manifest import DownloadManifest
 
 class ExportImages:
-    def __init__(self, url: str, api_key: str, project_id: int, output_dir: str = 'Dataset'):
+    def __init__(self, url: str, api_key: str, project_id: int, output_dir: str = 'Dataset',
+                 workers: int = 8, max_retries: int = 3, backoff_factor: float = 0.5,
+                 chunk_size: int = CHUNK_SIZE, revalidate: bool = False, verify_hash: bool = False,
+                 page_size: int = 100, blob_store=None, client: LabelStudioClient = None):
         self.url = url  # URL do Label Studio
         self.api_key = api_key  # Token de autenticação
         self.project_id = project_id  # ID do projeto
         self.output_dir = output_dir  # Pasta onde salvar as imagens
-        self.client = Client(url=self.url, api_key=self.api_key)  # Cliente da API
-        self.headers = {"Authorization": f"Token {self.api_key}"}  # Cabeçalho pra download
+        self.workers = max(1, workers)  # Quantidade de downloads simultâneos
+        self.chunk_size = chunk_size  # Tamanho do buffer de escrita de cada download
+        self.revalidate = revalidate  # Confirma com o servidor (ETag/Last-Modified) se imagens já baixadas mudaram
+        self.verify_hash = verify_hash  # Confere o sha256 das imagens já baixadas antes de pular
+        self.page_size = page_size  # Tasks buscadas por página da API
+        self.blob_store = blob_store  # BlobStore opcional: imagens iguais entre projetos ficam gravadas uma vez só
+        # Cliente da API (compartilhado com o resto do sistema quando passado)
+        self.client = client or LabelStudioClient(self.url, self.api_key, pool_size=self.workers,
+                                                  retries=max_retries, backoff_factor=backoff_factor)
+        # Sessão compartilhada entre as threads (keep-alive, pool de conexões e retry com backoff)
+        self.session = self.client.session
 
         print(f"[INFO] ExportImages inicializado para o projeto {self.project_id}")
 
@@ -22,41 +37,145 @@ class ExportImages:
             print(f"[ERRO] ExportImages.check_connection: Não foi possível conectar ao Label Studio")
             raise ConnectionError('Erro de conexão com Label Studio')
 
-    def download_images(self):
-        # Baixa todas as imagens do projeto 
+    def locate_image(self, image_filename):
+        # Procura a imagem na pasta images ou nos splits, caso o DataOrganizer já tenha movido
+        for folder in ('', 'train', 'val', 'test'):
+            path = os.path.join(self.output_dir, 'images', folder, image_filename)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def download_image(self, image_url, image_path, entry=None):
+        # Baixa uma única imagem em blocos direto para o disco usando a sessão compartilhada.
+        # Com entry (imagem já baixada antes) faz uma requisição condicional e não baixa de novo se não mudou
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        hasher = hashlib.sha256()
+        response = stream_download(self.session, image_url, image_path, chunk_size=self.chunk_size,
+                                   headers=headers or None, hasher=hasher)
+        if response.status_code == 304:
+            return None
+
+        digest = hasher.hexdigest()
+        if self.blob_store is not None:
+            self.blob_store.add_file(image_path, digest)
+
+        return {
+            'url': image_url,
+            'filename': os.path.basename(image_path),
+            'size': os.path.getsize(image_path),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': digest
+        }
+
+    def task_image(self, task):
+        # Retorna a URL completa e o nome do arquivo da imagem da task (ou None se ela não tiver imagem)
+        image_url = task['data'].get('image')
+        if not image_url:
+            return None, None
+
+        if image_url.startswith('/'):
+            image_url = f'{self.url}{image_url}'  # Corrige a URL incompleta
+        return image_url, os.path.basename(image_url)  # Extrai o nome do arquivo da URL
+
+    def download_images(self, tasks=None, on_task=None, split_assignment=None):
+        # Baixa em paralelo só as imagens que faltam ou mudaram desde a última exportação (via manifesto)
+        # e retorna um resumo com as falhas. on_task é chamado com cada task assim que ela chega (ex: conversão
+        # local das labels), enquanto os downloads seguem no pool.
+        # Com split_assignment ({nome sem extensão: split}) cada imagem vai direto para images/<split> e as
+        # que não estão no mapa (sem label ou com label vazia) não são baixadas.
+        # Se o download for interrompido (projeto, listagem de tasks, disco...) o erro fica em summary['error']
+        summary = {'downloaded': 0, 'cached': 0, 'skipped': 0, 'failed': [], 'error': None}
         try:
             print(f'[INFO] Iniciando download das imagens do projeto {self.project_id}')
-            project = self.client.get_project(self.project_id)
-            tasks = project.get_tasks()  # Lista todas as tasks
+            if tasks is None:
+                # Tasks chegam página por página, e os downloads começam já na primeira página
+                tasks = iter_tasks(self.session, self.url, self.project_id, page_size=self.page_size)
 
             images_path = os.path.join(self.output_dir, 'images')
             os.makedirs(images_path, exist_ok=True)  # Cria a pasta se não existir
+            for subset in set((split_assignment or {}).values()):
+                os.makedirs(os.path.join(images_path, subset), exist_ok=True)
+            manifest = DownloadManifest(self.output_dir)
 
-            for task in tasks:
-                image_url = task['data'].get('image')
-                if not image_url:
-                    print(f"[AVISO] Task {task['id']} sem imagem, ignorada")
-                    continue
-
-                if image_url.startswith('/'):
-                    image_url = f'{self.url}{image_url}'  # Corrige a URL incompleta
+            def collect(done_futures):
+                # Registra o resultado dos downloads concluídos no manifesto e no resumo
+                for future in done_futures:
+                    task_id, image_url = pending.pop(future)
+                    try:
+                        metadata = future.result()
+                        if metadata is None:
+                            summary['cached'] += 1  # Servidor respondeu 304, a imagem não mudou
+                        else:
+                            manifest.update(task_id, metadata)
+                            summary['downloaded'] += 1
+                            if summary['downloaded'] % 500 == 0:
+                                manifest.save()  # Salva o progresso para poder retomar se a exportação cair
+                    except Exception as e:
+                        # Falhas por imagem não interrompem o download, só entram no resumo
+                        summary['failed'].append({'task': task_id, 'url': image_url, 'error': str(e)})
 
+            # Limita os downloads em espera para a memória não crescer com o tamanho do projeto
+            max_pending = self.workers * 4
+            pending = {}
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
                 try:
-                    image_data = requests.get(image_url, headers=self.headers).content  # Baixa a imagem
-                except Exception as e:
-                    print(f"[ERRO] Erro ao baixar {image_url}: {e}")
-                    continue
+                    for task in tasks:
+                        if on_task is not None:
+                            on_task(task)
+
+                        image_url, image_filename = self.task_image(task)
+                        if not image_url:
+                            print(f"[AVISO] Task {task['id']} sem imagem, ignorada")
+                            summary['skipped'] += 1
+                            continue
 
-                image_filename = os.path.basename(image_url)  # Extrai o nome do arquivo da URL
-                image_path = os.path.join(images_path, image_filename)
+                        subset = None
+                        if split_assignment is not None:
+                            subset = split_assignment.get(os.path.splitext(image_filename)[0])
+                            if subset is None:
+                                summary['skipped'] += 1
+                                continue
 
-                print(f"[DEBUG] Salvando imagem: {image_filename}")
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)  # Salva a imagem
+                        existing_path = self.locate_image(image_filename)
+                        entry = manifest.get(task['id'])
+                        valid = manifest.is_valid(entry, image_url, existing_path, self.verify_hash)
+                        if valid and not self.revalidate:
+                            summary['cached'] += 1  # Já baixada e íntegra, nenhuma requisição necessária
+                            continue
 
-                print(f'[INFO] Baixada: {image_filename} -> {image_path}')
+                        # Substitui no mesmo lugar se já existir (mantém o split), senão baixa em images/
+                        image_path = existing_path or os.path.join(images_path, subset or '', image_filename)
+                        future = executor.submit(self.download_image, image_url, image_path, entry if valid else None)
+                        pending[future] = (task['id'], image_url)
+
+                        if len(pending) >= max_pending:
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            collect(done)
+                except Exception as e:
+                    # Uma página de tasks (ou a conversão de uma task) falhou no meio: as tasks seguintes não
+                    # chegaram, então a execução conta como interrompida. Os downloads já enviados terminam e
+                    # entram no manifesto abaixo, para não serem baixados de novo na próxima execução
+                    summary['error'] = f'Listagem das tasks interrompida: {e}'
 
-            print('[INFO] Download finalizado')
+                collect(list(pending))
+
+            manifest.save()
+
+            print(f"[INFO] Download finalizado: {summary['downloaded']} baixadas, {summary['cached']} já existentes, "
+                  f"{summary['skipped']} ignoradas, {len(summary['failed'])} com falha")
+            for failure in summary['failed']:
+                print(f"[ERRO] Task {failure['task']} ({failure['url']}): {failure['error']}")
+            if summary['error']:
+                print(f"[ERRO] {summary['error']}")
 
         except Exception as e:
+            summary['error'] = str(e)
             print(f"[ERRO] ExportImages.download_images: {e}")
+
+        return summary
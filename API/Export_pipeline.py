@@ -0,0 +1,59 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class ExportPipeline:
+    def __init__(self, stages, concurrency=None):
+        # stages: lista ordenada de (nome, função) em que cada função recebe o contexto do projeto
+        self.stages = stages
+        concurrency = concurrency or {}
+        # Um semáforo por etapa limita quantos projetos executam aquela etapa ao mesmo tempo,
+        # enquanto outros projetos avançam nas demais etapas
+        self.semaphores = {name: threading.Semaphore(max(1, concurrency.get(name, 1))) for name, _ in stages}
+        self.status = {}  # projeto -> {'stage', 'state', 'error', 'timings'}
+        self.lock = threading.Lock()
+
+    def set_status(self, item, stage, state, error=None):
+        with self.lock:
+            entry = self.status.setdefault(item, {'stage': None, 'state': None, 'error': None, 'timings': {}})
+            entry.update({'stage': stage, 'state': state, 'error': error})
+        if error is not None:
+            print(f"[ERRO] Pipeline projeto {item}: etapa '{stage}' falhou: {error}")
+        elif state != 'aguardando':
+            print(f"[PIPELINE] Projeto {item}: {stage or 'fim'} -> {state}")
+
+    def print_status(self):
+        # Mostra a situação atual de cada projeto e o tempo gasto em cada etapa
+        with self.lock:
+            snapshot = {item: dict(entry) for item, entry in self.status.items()}
+        print("\n[PIPELINE] Status dos projetos:")
+        for item, entry in snapshot.items():
+            timings = ', '.join(f"{name}: {seconds:.1f}s" for name, seconds in entry['timings'].items())
+            print(f" - Projeto {item}: {entry['state']} (etapa: {entry['stage'] or '-'}) [{timings}]")
+
+    def run_item(self, item, context):
+        # Executa as etapas de um projeto em ordem, esperando vaga em cada etapa
+        for name, function in self.stages:
+            self.set_status(item, name, 'aguardando')
+            with self.semaphores[name]:
+                self.set_status(item, name, 'executando')
+                start = time.perf_counter()
+                try:
+                    function(context)
+                except Exception as e:
+                    self.set_status(item, name, 'falhou', e)
+                    return False
+                finally:
+                    with self.lock:
+                        self.status[item]['timings'][name] = time.perf_counter() - start
+        self.set_status(item, None, 'concluído')
+        return True
+
+    def run(self, items):
+        # items: dict projeto -> contexto. Retorna os projetos concluídos, na ordem recebida
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=len(items)) as executor:
+            futures = {item: executor.submit(self.run_item, item, context) for item, context in items.items()}
+        self.print_status()
+        return [item for item, future in futures.items() if future.result()]
@@ -1,22 +1,83 @@
-from label_studio_sdk import Client
+import os
+import time
+from Http_session import stream_download, CHUNK_SIZE
+from LabelStudio_client import LabelStudioClient
 
 class ExportZipProject:
-    def __init__(self, url: str, api_key: str, project_id: int):
+    def __init__(self, url: str, api_key: str, project_id: int, export_dir: str = '.',
+                 poll_interval: float = 2.0, timeout: float = 1800.0, chunk_size: int = CHUNK_SIZE,
+                 client: LabelStudioClient = None):
         self.url = url  # URL do Label Studio
         self.api_key = api_key  # Token de autenticação
         self.project_id = project_id  # ID do projeto
-        self.client = Client(url=self.url, api_key=self.api_key)  # Instancia o cliente da API
+        self.export_dir = export_dir  # Pasta onde o ZIP exportado é salvo
+        self.poll_interval = poll_interval  # Intervalo entre as consultas de status da exportação
+        self.timeout = timeout  # Tempo máximo (s) esperando a exportação e a conversão ficarem prontas
+        self.chunk_size = chunk_size  # Tamanho do buffer de escrita do download
+        # Cliente da API (compartilhado com o resto do sistema quando passado)
+        self.client = client or LabelStudioClient(self.url, self.api_key, pool_size=1)
+        self.session = self.client.session  # Sessão usada nas chamadas REST e no download em blocos
 
         print(f"[INFO] ExportZipProject inicializado para o projeto {self.project_id}")
 
+    def export_status(self, export_id):
+        # Estado atual do snapshot de exportação no servidor
+        response = self.session.get(f'{self.url}/api/projects/{self.project_id}/exports/{export_id}', timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def poll(self, read_status, description):
+        # Consulta o status até ele ser 'completed'; falha se o servidor responder 'failed' ou se passar de timeout
+        deadline = time.monotonic() + self.timeout
+        while True:
+            status = read_status()
+            if status == 'completed':
+                return
+            if status == 'failed':
+                raise Exception(f'[ExportZipProject] {description} falhou no servidor')
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'[ExportZipProject] {description} não terminou em {self.timeout:.0f}s '
+                                   f'(último status: {status})')
+            time.sleep(self.poll_interval)
+
+    def wait_export(self, export_id):
+        # Espera o snapshot de exportação ficar pronto no servidor
+        self.poll(lambda: self.export_status(export_id).get('status'), f'Exportação {export_id}')
+
+    def convert_export(self, export_id, export_type):
+        # Pede ao servidor a conversão do snapshot para o formato desejado e espera terminar
+        convert_url = f'{self.url}/api/projects/{self.project_id}/exports/{export_id}/convert'
+        response = self.session.post(convert_url, json={'export_type': export_type}, timeout=60)
+        if response.status_code == 404:
+            return  # Versões antigas do Label Studio convertem direto no download
+        response.raise_for_status()
+
+        def conversion_status():
+            # O formato pode ainda não aparecer em converted_formats logo depois do pedido: continua esperando
+            formats = self.export_status(export_id).get('converted_formats') or []
+            return next((f.get('status') for f in formats if f.get('export_type') == export_type), None)
+
+        self.poll(conversion_status, f'Conversão para {export_type}')
+
     def export_project(self):
         # Exporta o projeto no formato YOLO
         try:
             print('[ExportZipProject] Conectando ao projeto...')
-            project = self.client.get_project(self.project_id)
+            self.client.get_project(self.project_id)
 
             print('[INFO] Iniciando exportação no formato YOLO...')
-            export_data = project.export(export_type='YOLO')  # Faz a exportação
+            response = self.session.post(f'{self.url}/api/projects/{self.project_id}/exports/',
+                                         json={'title': 'SDK Export'}, timeout=60)
+            response.raise_for_status()
+            export_id = response.json()['id']
+            self.wait_export(export_id)
+            self.convert_export(export_id, 'YOLO')
+
+            # Baixa o ZIP em blocos direto para o disco em vez de carregar tudo na memória
+            os.makedirs(self.export_dir, exist_ok=True)
+            export_data = os.path.join(self.export_dir, f'project-{self.project_id}-export-{export_id}.zip')
+            stream_download(self.session, f'{self.url}/api/projects/{self.project_id}/exports/{export_id}/download',
+                            export_data, chunk_size=self.chunk_size, timeout=600, params={'exportType': 'YOLO'})
 
             print('[INFO] Exportação finalizada com sucesso!')
             return export_data
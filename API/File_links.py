@@ -0,0 +1,54 @@
+import os
+import shutil
+
+try:
+    import fcntl  # Só existe em sistemas Unix, usado para o reflink
+except ImportError:
+    fcntl = None
+
+# ioctl do Linux que clona os blocos de um arquivo (btrfs, XFS) sem copiar os dados
+FICLONE = 0x40049409
+LINK_MODES = ('hardlink', 'reflink', 'symlink', 'copy')
+
+
+def reflink(src, dst):
+    # Cria dst compartilhando os blocos de src (copy-on-write). Falha com OSError se o sistema não suportar
+    if fcntl is None:
+        raise OSError('reflink não suportado neste sistema')
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+def link_file(src, dst, mode='hardlink'):
+    # Coloca src em dst sem duplicar os dados quando possível e retorna o modo realmente usado.
+    # hardlink e reflink caem para cópia quando não são possíveis (outro disco, sistema sem suporte)
+    if mode not in LINK_MODES:
+        raise ValueError(f'Modo de link inválido: {mode}. Use um de {LINK_MODES}')
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        try:
+            reflink(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+
+    shutil.copy2(src, dst)
+    return 'copy'
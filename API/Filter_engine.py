@@ -0,0 +1,134 @@
+import os
+import time
+import cv2
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Estimativa de memória por pixel de uma imagem em processamento (imagem BGR + intermediários do filtro)
+BYTES_PER_PIXEL = 16
+
+# Flag do cv2.imread para cada (cinza, escala): a escala reduzida já é aplicada pelo decodificador
+# (no JPEG o DCT é decodificado direto em 1/2, 1/4 ou 1/8), sem decodificar a imagem inteira antes
+READ_FLAGS = {
+    (False, 1): cv2.IMREAD_COLOR,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (True, 1): cv2.IMREAD_GRAYSCALE,
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def read_flag(gray=False, scale=1):
+    # Flag de leitura para decodificar já em tons de cinza e/ou em escala reduzida (1, 2, 4 ou 8)
+    if (bool(gray), scale) not in READ_FLAGS:
+        raise ValueError(f'Escala de leitura inválida: {scale}. Use 1, 2, 4 ou 8')
+    return READ_FLAGS[(bool(gray), scale)]
+
+
+def init_worker():
+    # Cada processo já é um worker: o OpenCV não abre threads próprias para não disputar os núcleos
+    cv2.setNumThreads(1)
+
+
+def filter_file(src, dst, func, params, flag=cv2.IMREAD_COLOR):
+    # Decodifica uma imagem (com a flag de leitura pedida), aplica o filtro e grava o resultado
+    img = cv2.imread(src, flag)
+    if img is None:
+        raise ValueError('não foi possível ler a imagem')
+    result = func(img, **params)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if not cv2.imwrite(dst, result):
+        raise ValueError('não foi possível gravar o resultado')
+
+
+def run_chunk(chunk, func, params, flag=cv2.IMREAD_COLOR):
+    # Processa um bloco de (origem, destino) e retorna quantos deram certo e os erros de cada arquivo
+    done = 0
+    errors = []
+    for src, dst in chunk:
+        try:
+            filter_file(src, dst, func, params, flag)
+            done += 1
+        except Exception as e:
+            errors.append((src, str(e)))
+    return done, errors
+
+
+class FilterEngine:
+    def __init__(self, workers=None, chunk_size=16, memory_budget_mb=None, progress_interval=2.0):
+        # Executa um filtro sobre muitas imagens em um pool de processos, distribuindo blocos de arquivos.
+        # Com memory_budget_mb o número de processos é limitado para as imagens em memória caberem no orçamento
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size  # Arquivos por tarefa enviada a um processo
+        self.memory_budget_mb = memory_budget_mb
+        self.progress_interval = progress_interval  # Segundos entre as mensagens de progresso
+
+    def effective_workers(self, bytes_per_image=None):
+        # Cada processo segura uma imagem por vez, então o orçamento dividido pelo tamanho da maior imagem
+        # dá quantos processos podem rodar juntos
+        if not self.memory_budget_mb or not bytes_per_image:
+            return self.workers
+        fits = int(self.memory_budget_mb * 1024 * 1024 // bytes_per_image)
+        return max(1, min(self.workers, fits))
+
+    @staticmethod
+    def image_bytes(width, height):
+        return width * height * BYTES_PER_PIXEL
+
+    def report(self, description, done, total, start):
+        elapsed = time.monotonic() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"[INFO] {description}: {done}/{total} imagens ({rate:.1f} imagens/s)")
+
+    def run(self, jobs, func, params=None, description='filtro', bytes_per_image=None, flag=cv2.IMREAD_COLOR):
+        # jobs: lista de (origem, destino). func(img, **params) recebe a imagem lida com flag (BGR por padrão) e
+        # retorna a imagem a gravar; precisa ser uma função de módulo (é enviada aos processos).
+        # Retorna {'processed', 'failed'}
+        params = params or {}
+        total = len(jobs)
+        workers = self.effective_workers(bytes_per_image)
+        chunks = iter([jobs[i:i + self.chunk_size] for i in range(0, total, self.chunk_size)])
+        processed = 0
+        failed = []
+        start = time.monotonic()
+        last_report = start
+
+        print(f"[INFO] {description}: {total} imagens em {workers} processos")
+        if workers == 1:
+            # Sem ganho em abrir processos: roda no próprio processo
+            for chunk in chunks:
+                done, errors = run_chunk(chunk, func, params, flag)
+                processed += done
+                failed.extend(errors)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self.report(description, processed + len(failed), total, start)
+                    last_report = time.monotonic()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                # Só alguns blocos ficam na fila por processo, para não enfileirar o dataset inteiro de uma vez
+                pending = {executor.submit(run_chunk, chunk, func, params, flag)
+                           for chunk in islice(chunks, workers * 2)}
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done, errors = future.result()
+                        processed += done
+                        failed.extend(errors)
+                        chunk = next(chunks, None)
+                        if chunk is not None:
+                            pending.add(executor.submit(run_chunk, chunk, func, params, flag))
+                    if time.monotonic() - last_report >= self.progress_interval:
+                        self.report(description, processed + len(failed), total, start)
+                        last_report = time.monotonic()
+
+        self.report(description, processed + len(failed), total, start)
+        if failed:
+            print(f"[ERRO] {len(failed)} imagens falharam:")
+            for src, error in failed[:20]:
+                print(f"[ERRO] Falha ao processar: {src} ({error})")
+            if len(failed) > 20:
+                print(f"[ERRO] ... e mais {len(failed) - 20}")
+        return {'processed': processed, 'failed': failed}
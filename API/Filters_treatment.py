@@ -1,14 +1,149 @@
 import os
-import glob
 import cv2
 import shutil
 import numpy as np
-import re
-from collections import Counter, defaultdict
+from collections import defaultdict
 from PIL import Image, ImageEnhance
+from Dataset_registry import DatasetRegistry
+from Dataset_index import DatasetIndex
+from Duplicate_finder import DuplicateFinder
+from Filter_engine import FilterEngine, read_flag
+
+# Filtros de imagem: recebem a imagem decodificada (BGR, ou cinza quando vem de outro filtro de um pipeline)
+# e retornam a imagem a ser gravada. Ficam no nível do módulo para poderem ser enviados aos processos do FilterEngine
+
+def to_gray(img):
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def to_bgr(img):
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img
+
+
+def grayscale(img):
+    return to_gray(img)
+
+
+def threshold(img, inverse=False):
+    gray = to_gray(img)
+    _, result = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV if inverse else cv2.THRESH_BINARY)
+    return result
+
+
+def canny(img):
+    gray = to_gray(img)
+    return cv2.Canny(gray, 100, 200)
+
+
+def canny_lines(img):
+    img = to_bgr(img)
+    gray = to_gray(img)
+    edges = cv2.Canny(gray, 100, 200)
+
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 150, None, 0, 0)
+    if lines is not None:
+        for line in lines:
+            x1, y1, x2, y2 = line[0]
+            cv2.line(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    return img
+
+
+def laplacian(img, tile_rows=None):
+    # O resultado de um 3x3 sobre uint8 cabe em int16 (|x| <= 1020), então CV_16S dá a mesma saída do CV_64F
+    # depois do convertScaleAbs com 1/4 da memória. Com tile_rows a imagem é processada em faixas de linhas,
+    # cada uma com 1 linha extra de cada lado (o alcance do kernel), que é descartada
+    gray = to_gray(img)
+    height = gray.shape[0]
+    if not tile_rows or height <= tile_rows:
+        return cv2.convertScaleAbs(cv2.Laplacian(gray, cv2.CV_16S))
+
+    result = np.empty_like(gray)
+    for y0 in range(0, height, tile_rows):
+        y1 = min(y0 + tile_rows, height)
+        top = max(y0 - 1, 0)
+        strip = cv2.Laplacian(gray[top:min(y1 + 1, height)], cv2.CV_16S)
+        result[y0:y1] = cv2.convertScaleAbs(strip[y0 - top:y1 - top])
+    return result
+
+
+def kernel_filter(img, kernel):
+    gray = to_gray(img)
+    filtered = cv2.filter2D(gray, -1, kernel)
+    return cv2.normalize(filtered, None, 0, 255, cv2.NORM_MINMAX)
+
+
+# Planos constantes 128 já alocados neste processo, por (formato, tipo), reaproveitados entre imagens
+FILLED_128 = {}
+
+
+def filled_128(like):
+    key = (like.shape, like.dtype.str)
+    plane = FILLED_128.get(key)
+    if plane is None:
+        if len(FILLED_128) >= 4:
+            FILLED_128.clear()  # Muitas resoluções diferentes: não acumula buffers
+        plane = FILLED_128[key] = np.full_like(like, 128)
+    return plane
+
+
+def contrast(img):
+    lab = cv2.cvtColor(to_bgr(img), cv2.COLOR_BGR2LAB)
+    l_channel, a, b = cv2.split(lab)
+
+    clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8,8))
+    cl = clahe.apply(l_channel)
+
+    # O plano 128 é só lido, então o mesmo buffer serve para os dois canais e para as próximas imagens
+    gray_128 = filled_128(a)
+    a = cv2.addWeighted(a, 1.1, gray_128, -0.1, 0)
+    b = cv2.addWeighted(b, 1.1, gray_128, -0.1, 0)
+
+    limg = cv2.merge((cl,a,b))
+    return cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+
+
+# Faixa de linhas do Laplaciano no modo de pouca memória
+LOW_MEMORY_TILE_ROWS = 256
+
+DEFAULT_KERNEL = np.array([[-1, -1, -1], [-1, 8, -1],[-1, -1, -1]])
+
+# Etapas disponíveis para os pipelines: nome -> (filtro, parâmetros padrão, só usa a imagem em cinza)
+STAGES = {
+    'grayscale': (grayscale, {}, True),
+    'threshold': (threshold, {}, True),
+    'threshold_inv': (threshold, {'inverse': True}, True),
+    'canny': (canny, {}, True),
+    'canny_lines': (canny_lines, {}, False),
+    'laplacian': (laplacian, {}, True),
+    'kernel': (kernel_filter, {'kernel': DEFAULT_KERNEL}, True),
+    'contrast': (contrast, {}, False),
+}
+
+
+def run_pipeline(img, stages):
+    # Aplica as etapas em ordem sobre a mesma imagem em memória: stages é uma lista de (nome, parâmetros)
+    for name, params in stages:
+        func, defaults, _ = STAGES[name]
+        img = func(img, **{**defaults, **params})
+    return img
+
 
 class DatasetFilter:
-    def __init__(self, dataset_id, base_path='.'):
+    def __init__(self, dataset_id, base_path='.', blob_store=None, registry=None, workers=None,
+                 memory_budget_mb=None, decode_scale=1, low_memory=False):
+        # BlobStore opcional: cópias de imagens sem alteração (ex: organização por resolução) viram links
+        self.blob_store = blob_store
+        # Registro dos datasets exportados/concatenados, usado para achar as pastas pelo ID
+        self.registry = registry or DatasetRegistry(base_path)
+        # Engine que aplica os filtros em paralelo (processos), limitado pelo orçamento de memória se informado
+        self.engine = FilterEngine(workers=workers, memory_budget_mb=memory_budget_mb)
+        # Escala de leitura dos filtros (1, 2, 4 ou 8): > 1 decodifica já reduzido, para prévias e análises
+        read_flag(scale=decode_scale)
+        self.decode_scale = decode_scale
+        # Modo de pouca memória: o Laplaciano é calculado em faixas de linhas em vez da imagem inteira
+        self.low_memory = low_memory
+        # Índice dos arquivos do dataset, criado no primeiro uso
+        self.index = None
         # Encontra a pasta do dataset a partir do ID informado
         self.dataset_path = self.find_dataset_path(dataset_id, base_path)
         if not self.dataset_path:
@@ -18,48 +153,41 @@ class DatasetFilter:
 
     def find_dataset_path(self, dataset_id, base_path):
         if isinstance(dataset_id, str):
-            ids_desejados = dataset_id.split('_')
+            ids_desejados = [int(id_) for id_ in dataset_id.split('_')]
         else:
-            ids_desejados = [str(dataset_id)]
+            ids_desejados = [int(dataset_id)]
 
-        # Se forem múltiplos IDs busca em Dataset_concatenado
+        # Se forem múltiplos IDs busca entre os datasets concatenados
         if len(ids_desejados) > 1:
-            concat_path = os.path.join(base_path, 'Dataset_concatenado')
-            if os.path.exists(concat_path):
-                for nome in os.listdir(concat_path):
-                    total_path = os.path.join(concat_path, nome)
-                    if not os.path.isdir(total_path):
-                        continue
-                    ids_encontrados = re.findall(r'\d+', nome)
-                    if all(id_ in ids_encontrados for id_ in ids_desejados):
-                        return os.path.join(concat_path, nome)
-
-        # Se for só um ID busca na raiz
-        for nome in os.listdir(base_path):
-            if not os.path.isdir(os.path.join(base_path, nome)):
-                continue
-            ids_encontrados = re.findall(r'\d+', nome)
-            if ids_desejados[0] in ids_encontrados:
-                return os.path.join(base_path, nome)
+            path = self.registry.find_concatenation(ids_desejados)
+            if path:
+                return path
+
+        # Se for só um ID busca o projeto exportado (ID exato)
+        path = self.registry.find_project(ids_desejados[0])
+        if path:
+            return path
 
         print(f"[ERRO] Nenhum dataset com ID(s) {ids_desejados} encontrado.")
         return None
 
+    def file_index(self):
+        # Índice de arquivos do dataset; a cada uso só as imagens novas ou alteradas são relidas
+        if self.index is None:
+            sources = self.registry.sources(self.dataset_path)
+            self.index = DatasetIndex(self.dataset_path, project_id=sources[0] if len(sources) == 1 else None)
+        return self.index.refresh()
+
+    def image_paths(self):
+        # Imagens (.jpg, .jpeg, .png) de images/, vindas do índice em vez de um glob
+        return self.file_index().images()
+
     def list_resolutions(self):
         print(f"\n[INFO] Analisando resoluções em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        resolucoes = Counter()
-        total = 0
-
-        for img_path in caminhos:
-            if img_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-                img = cv2.imread(img_path)
-                if img is not None:
-                    h, w = img.shape[:2]
-                    resolucoes[(w, h)] += 1
-                    total += 1
-            else:
-                print(f"[ERRO] Falha ao ler: {img_path}")
+        index = self.file_index()
+        for img_path in index.unreadable():
+            print(f"[ERRO] Falha ao ler: {img_path}")
+        resolucoes = index.resolutions()
 
         if not resolucoes:
             print("[INFO] Nenhuma imagem encontrada")
@@ -70,224 +198,134 @@ class DatasetFilter:
 
     def resolution_organizer(self):
         print(f'\n[INFO] Organizando as imagens por resolução: {self.dataset_path}')
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        index = self.file_index()
+        for img_path in index.unreadable():
+            print(f"[ERRO] Falha ao ler: {img_path}")
 
         output_dir = os.path.join(self.dataset_path, 'resolucoes_organizadas')
         os.makedirs(output_dir, exist_ok=True)
 
         total = 0
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is not None:
-                h, w = img.shape[:2]
-                nome_resolucao = f'{w}x{h}'
-
-                subdir = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images')).split(os.sep)[0]
-                img_dest_dir = os.path.join(output_dir, nome_resolucao, 'images', subdir)
-                ext = os.path.splitext(img_path)[1].lower()
-                label_src_path = img_path.replace(os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep).replace(ext, '.txt')
-                label_dest_dir = os.path.join(output_dir, nome_resolucao, 'labels', subdir)
-
-                os.makedirs(img_dest_dir, exist_ok=True)
-                os.makedirs(label_dest_dir, exist_ok=True)
-
-                shutil.copy2(img_path, os.path.join(img_dest_dir, os.path.basename(img_path)))
-                if os.path.exists(label_src_path):
-                    shutil.copy2(label_src_path, os.path.join(label_dest_dir, os.path.basename(label_src_path)))
-                else:
-                    print(f"[INFO] Label não encontrada para {img_path}")
-
-                total += 1
+        # A resolução de cada imagem vem do índice, sem decodificar a imagem
+        for img_path, (w, h) in index.sizes().items():
+            nome_resolucao = f'{w}x{h}'
+
+            subdir = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images')).split(os.sep)[0]
+            img_dest_dir = os.path.join(output_dir, nome_resolucao, 'images', subdir)
+            ext = os.path.splitext(img_path)[1].lower()
+            label_src_path = img_path.replace(os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep).replace(ext, '.txt')
+            label_dest_dir = os.path.join(output_dir, nome_resolucao, 'labels', subdir)
+
+            os.makedirs(img_dest_dir, exist_ok=True)
+            os.makedirs(label_dest_dir, exist_ok=True)
+
+            img_dest_path = os.path.join(img_dest_dir, os.path.basename(img_path))
+            if self.blob_store is not None:
+                self.blob_store.store_file(img_path, img_dest_path)
+            else:
+                shutil.copy2(img_path, img_dest_path)
+            if os.path.exists(label_src_path):
+                shutil.copy2(label_src_path, os.path.join(label_dest_dir, os.path.basename(label_src_path)))
             else:
-                print(f"[ERRO] Falha ao ler: {img_path}")
+                print(f"[INFO] Label não encontrada para {img_path}")
+
+            total += 1
 
         print(f'[INFO] {total} imagens organizadas por resolução em: {output_dir}')
 
-    def apply_grayscale(self):
-        print(f"\n[INFO] Aplicando filtro grayscale em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'grayscale')
+    def peak_image_bytes(self, index=None):
+        # Memória estimada para processar a maior imagem do dataset, usada no orçamento de memória do engine.
+        # index: índice já atualizado, para não varrer o dataset de novo
+        resolucoes = (index or self.file_index()).resolutions()
+        if not resolucoes:
+            return None
+        return max(FilterEngine.image_bytes(w, h) for w, h in resolucoes)
+
+    def run_filter(self, output_folder, func, params=None, gray=False):
+        # Aplica func em todas as imagens de images/ no engine paralelo, gravando em <dataset>/<output_folder>
+        # com a mesma estrutura de pastas, e retorna a pasta de saída.
+        # gray decodifica direto em tons de cinza (filtros que só usam o cinza); com decode_scale > 1 a leitura
+        # já sai reduzida e o resultado vai para <output_folder>_reduzido_<escala>, separado do tamanho original
+        flag = read_flag(gray, self.decode_scale)
+        if self.decode_scale > 1:
+            output_folder = f'{output_folder}_reduzido_{self.decode_scale}'
+        images_dir = os.path.join(self.dataset_path, 'images')
+        output_dir = os.path.join(self.dataset_path, output_folder)
         os.makedirs(output_dir, exist_ok=True)
 
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is not None:
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-                out_path = os.path.join(output_dir, nome)
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                cv2.imwrite(out_path, gray)
-            else:
-                print(f"[ERRO] Falha ao processar: {img_path}")
+        index = self.file_index()  # Uma varredura só, para o orçamento de memória e para a lista de imagens
+        peak = self.peak_image_bytes(index)
+        if peak is not None:
+            peak //= self.decode_scale ** 2
+        jobs = [(img_path, os.path.join(output_dir, os.path.relpath(img_path, images_dir)))
+                for img_path in index.images()]
+        self.engine.run(jobs, func, params, description=output_folder, bytes_per_image=peak, flag=flag)
+        return output_dir
+
+    def stage_params(self, name, params=None):
+        # Parâmetros de uma etapa com os ajustes do modo de pouca memória (os informados têm prioridade)
+        extra = {'tile_rows': LOW_MEMORY_TILE_ROWS} if self.low_memory and name == 'laplacian' else {}
+        return {**extra, **(params or {})}
 
+    def apply_grayscale(self):
+        print(f"\n[INFO] Aplicando filtro grayscale em: {self.dataset_path}")
+        output_dir = self.run_filter('grayscale', grayscale, gray=True)
         print(f"[INFO] Todas as imagens salvas em: {output_dir}")
 
     def apply_threshold(self):
         print(f"\n[INFO] Aplicando filtro threshold em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'threshold')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is not None:
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                _, treshold = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-                nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-                out_path = os.path.join(output_dir, nome)
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                cv2.imwrite(out_path, treshold)
-            else:
-                print(f"[ERRO] Falha ao processar: {img_path}")
-
+        output_dir = self.run_filter('threshold', threshold, gray=True)
         print(f"[INFO] Todas as imagens salvas em: {output_dir}")
 
     def apply_threshold_inv(self):
         print(f"\n[INFO] Aplicando filtro threshold invertido em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'threshold_invertido')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is not None:
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                _, threshold = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
-                nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-                out_path = os.path.join(output_dir, nome)
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                cv2.imwrite(out_path, threshold)
-            else:
-                print(f"[ERRO] Falha ao processar: {img_path}")
-
+        output_dir = self.run_filter('threshold_invertido', threshold, {'inverse': True}, gray=True)
         print(f"[INFO] Todas as imagens salvas em: {output_dir}")
 
     def apply_canny(self):
         print(f"\n[INFO] Aplicando filtro Canny em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'canny')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 100, 200)
-
-            nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-            out_path = os.path.join(output_dir, nome)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, edges)
-
+        output_dir = self.run_filter('canny', canny, gray=True)
         print(f"[INFO] Todas as imagens salvas em: {output_dir}")
     
     def draw_canny_lines(self):
         print(f"\nAplicando filtro de Canny com linhas: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'canny_lines')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-        
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 100, 200)
-
-            lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 150, None, 0, 0)
-            if lines is not None:
-                for line in lines:
-                    x1, y1, x2, y2 = line[0]
-                    cv2.line(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-            out_path = os.path.join(output_dir, nome)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, img)
+        output_dir = self.run_filter('canny_lines', canny_lines)
         print(f"[OK] Todas as imagens salvas em: {output_dir}")
 
     def apply_laplacian(self):
         print(f"\nAplicando filtro de laplacian em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'laplacian')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-        
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-            laplacian = cv2.convertScaleAbs(laplacian)
-
-            nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-            out_path = os.path.join(output_dir, nome)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, laplacian)
+        output_dir = self.run_filter('laplacian', laplacian, self.stage_params('laplacian'), gray=True)
         print(f"[OK] Todas as imagens salvas em: {output_dir}")
 
     def apply_kernel(self, kernel):
         print(f"\nAplicando filtro de kernel em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'kernel')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-        
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            filtered = cv2.filter2D(gray, -1, kernel)
-            filtered = cv2.normalize(filtered, None, 0, 255, cv2.NORM_MINMAX)
-
-            nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-            out_path = os.path.join(output_dir, nome)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, filtered)
+        output_dir = self.run_filter('kernel', kernel_filter, {'kernel': kernel}, gray=True)
         print(f"[OK] Todas as imagens salvas em: {output_dir}")
 
     def apply_contrast(self):
         print(f"\nAplicando filtro de contraste em: {self.dataset_path}")
-        caminhos = glob.glob(os.path.join(self.dataset_path, 'images', '**', '*.*'), recursive=True)
-        caminhos = [p for p in caminhos if p.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        output_dir = os.path.join(self.dataset_path, 'contraste')
-        os.makedirs(output_dir, exist_ok=True)
-
-        for img_path in caminhos:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-        
-            lab= cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-            l_channel, a, b = cv2.split(lab)
-
-            clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8,8))
-            cl = clahe.apply(l_channel)
-
-            a = cv2.addWeighted(a, 1.1, np.full_like(a, 128), -0.1, 0)
-            b = cv2.addWeighted(b, 1.1, np.full_like(b, 128), -0.1, 0)
-
-            limg = cv2.merge((cl,a,b))
-            enhanced_img = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+        output_dir = self.run_filter('contraste', contrast)
+        print(f"[OK] Todas as imagens salvas em: {output_dir}")
 
-            nome = os.path.relpath(img_path, os.path.join(self.dataset_path, 'images'))
-            out_path = os.path.join(output_dir, nome)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, enhanced_img)
+    @staticmethod
+    def parse_pipeline(text):
+        # "contrast grayscale canny" -> [('contrast', {}), ('grayscale', {}), ('canny', {})]
+        return [(name, {}) for name in text.split()]
+
+    def apply_pipeline(self, stages, output_folder=None):
+        # Aplica várias etapas com uma única decodificação e uma única gravação por imagem.
+        # stages: lista de (nome, parâmetros) com nomes de STAGES, ex: [('contrast', {}), ('canny', {})]
+        stages = [(name, self.stage_params(name, params)) for name, params in stages]
+        invalid = [name for name, _ in stages if name not in STAGES]
+        if not stages or invalid:
+            raise ValueError(f"Pipeline inválido: {invalid or 'vazio'}. Etapas: {', '.join(STAGES)}")
+
+        output_folder = output_folder or '_'.join(name for name, _ in stages)
+        print(f"\nAplicando pipeline {' -> '.join(name for name, _ in stages)} em: {self.dataset_path}")
+        # Se a primeira etapa só usa o cinza, a imagem já é decodificada em tons de cinza
+        output_dir = self.run_filter(output_folder, run_pipeline, {'stages': stages}, gray=STAGES[stages[0][0]][2])
         print(f"[OK] Todas as imagens salvas em: {output_dir}")
+        return output_dir
 
     def remove_labels_id(self):
         resposta = input("Digite os IDs das classes que irão ser remover, separados por espaço (ex: 0 1 2)").strip()
@@ -405,18 +443,14 @@ class DatasetFilter:
         base_path = os.path.join(self.dataset_path, 'images')
 
         result = []
+        counts = self.file_index().counts_by_project()  # Contagem por split e projeto direto do índice
 
         for folder in folders:
-            counter = defaultdict(int)
             complete_folder = os.path.join(base_path, folder)
             if not os.path.exists(complete_folder):
                 continue
 
-            for file in os.listdir(complete_folder):
-                if not file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    continue
-                id_dataset = file.split('_')[0]
-                counter[id_dataset] += 1
+            counter = {str(id_dataset): qtd for id_dataset, qtd in counts.get(folder, {}).items()}
             
             result.append(f"Pasta: {folder}")
             for id_dataset, qtd in sorted(counter.items()):
@@ -440,37 +474,20 @@ class DatasetFilter:
             print(f"Pasta {folder_resolution} não existe")
             return
 
-        def map_datasets_names(root_path, dataset_folder_name):
-            def extrair_ids(nome):
-                return set(re.findall(r'(\d+)', nome))
-            
-            ids_referencia = extrair_ids(dataset_folder_name)
-            id_to_name = {}
+        def map_datasets_names(dataset_path):
+            # Nome de cada projeto de origem do dataset, a partir das pastas exportadas no registro
+            ids_referencia = self.registry.sources(dataset_path)
             print(f'IDs da pasta de referência: {ids_referencia}')
-            print(f'Verificando pastas em {root_path}')
-            
-            for folder in os.listdir(root_path):
-                full_path = os.path.join(root_path, folder)
-                if not os.path.isdir(full_path):
-                    continue
-
-                ids_pasta = extrair_ids(folder)
-                if ids_referencia & ids_pasta:
-                    parts = folder.split('_')
-                    datasets_ids = [i for i in parts if i.isdigit()]
-                    if datasets_ids:
-                        dataset_id = datasets_ids[-1]
-                        name = folder.replace(f"_{dataset_id}", "").split("Dataset_-_")[-1]
-                        print(f"Incluindo {folder} no mapeamento. ID principal: {dataset_id} → nome: '{name}'")
-                        id_to_name[dataset_id] = name
-                    else:
-                        print(f"Incluindo {folder} mas ID não foi extraído normalmente")
-                else:
-                    print(f"Ignorando {folder} (sem IDs em comum com {dataset_folder_name})")
 
+            id_to_name = {}
+            for dataset_id, path in self.registry.project_paths(ids_referencia).items():
+                folder = os.path.basename(path)
+                name = folder.replace(f"_{dataset_id}", "").split("Dataset_-_")[-1]
+                print(f"Incluindo {folder} no mapeamento. ID principal: {dataset_id} → nome: '{name}'")
+                id_to_name[str(dataset_id)] = name
             return id_to_name
 
-        id_to_name = map_datasets_names(root_path = '.', dataset_folder_name=base_name)
+        id_to_name = map_datasets_names(self.dataset_path)
 
         images_id = defaultdict(lambda: defaultdict(list))
 
@@ -525,6 +542,29 @@ class DatasetFilter:
         
         print(f"Relatório de contagem por pasta salvo em {detail_path}")
 
+    def find_duplicates(self, max_distance=4, action=None):
+        # Procura imagens quase iguais (hash perceptual), gera o relatório de grupos e de vazamento entre splits
+        # e opcionalmente apaga as duplicatas ('drop') ou troca as cópias idênticas por hardlinks ('hardlink')
+        print(f"\nProcurando imagens duplicadas em: {self.dataset_path}")
+        finder = DuplicateFinder(self.file_index(), max_distance=max_distance)
+        clusters = finder.find_clusters()
+
+        output_path = os.path.join(self.dataset_path, "Relatorios",
+                                   f"Relatorio_duplicatas_{os.path.basename(self.dataset_path)}.txt")
+        finder.write_report(clusters, output_path)
+        print(f"[INFO] {len(clusters)} grupos de duplicatas, {len(finder.leaking(clusters))} com vazamento entre splits")
+
+        if not clusters:
+            return clusters
+        if action is None:
+            resposta = input("Apagar as duplicatas (a), trocar cópias idênticas por hardlinks (h) ou nada (ENTER)? ")
+            action = {'a': 'drop', 'h': 'hardlink'}.get(resposta.strip().lower())
+        if action == 'drop':
+            finder.drop(clusters)
+        elif action == 'hardlink':
+            finder.hardlink(clusters)
+        return clusters
+
     def run_menu(self):
         while True:
             print("\nEscolha um filtro para aplicar:")
@@ -542,6 +582,10 @@ class DatasetFilter:
             print("12) Mudar as classes das labels do diretório")
             print("13) Gerar o relatório de contagem de imagens por pasta")
             print("14) Gerar o relatório de contagem de imagens 4K")
+            print("15) Procurar imagens duplicadas")
+            print("16) Pipeline de filtros (vários filtros com uma leitura por imagem)")
+            print(f"17) Escala de leitura dos filtros (atual: 1/{self.decode_scale})")
+            print(f"18) Modo de pouca memória para imagens grandes (atual: {'ligado' if self.low_memory else 'desligado'})")
             print("0) Voltar")
 
             choice = input("Opção: ").strip()
@@ -561,8 +605,7 @@ class DatasetFilter:
             elif choice == '7':
                 self.apply_laplacian()
             elif choice == '8':
-                kernel = np.array([[-1, -1, -1], [-1, 8, -1],[-1, -1, -1]])
-                self.apply_kernel(kernel)
+                self.apply_kernel(DEFAULT_KERNEL)
             elif choice == '9':
                 self.draw_canny_lines()
             elif choice == '10':
@@ -575,6 +618,23 @@ class DatasetFilter:
                 self.review_generation()
             elif choice == '14':
                 self.review_generation_4k()
+            elif choice == '15':
+                self.find_duplicates()
+            elif choice == '16':
+                print(f"Etapas disponíveis: {', '.join(STAGES)}")
+                texto = input("Digite as etapas em ordem, separadas por espaço (ex: contrast grayscale canny): ")
+                try:
+                    self.apply_pipeline(self.parse_pipeline(texto))
+                except ValueError as e:
+                    print(f"[ERRO] {e}")
+            elif choice == '17':
+                escala = input("Escala de leitura (1 = original; 2, 4 ou 8 = prévia reduzida): ").strip()
+                if escala in ('1', '2', '4', '8'):
+                    self.decode_scale = int(escala)
+                else:
+                    print("Escala inválida.")
+            elif choice == '18':
+                self.low_memory = not self.low_memory
             elif choice == '0':
                 break
             else:
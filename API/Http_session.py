@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Status HTTP que valem uma nova tentativa (limite de requisições e falhas temporárias do servidor)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Tamanho do bloco lido da rede e escrito no disco por vez (limita a memória usada por download)
+CHUNK_SIZE = 1024 * 1024
+
+
+def build_adapter(pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5):
+    # Adapter com pool de conexões por host e retry com backoff
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,  # Espera backoff_factor * 2^(tentativa - 1) segundos entre tentativas
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+
+    # pool_maxsize limita as conexões abertas por host e pool_block faz as threads esperarem por uma conexão livre
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+
+def build_session(api_key: str, pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5):
+    # Cria uma sessão HTTP compartilhada com keep-alive, limite de conexões por host e retry com backoff
+    adapter = build_adapter(pool_size, retries, backoff_factor)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({"Authorization": f"Token {api_key}"})
+    return session
+
+
+def stream_download(session, url: str, dest_path: str, chunk_size: int = CHUNK_SIZE, timeout: int = 60, params=None,
+                    headers=None, hasher=None):
+    # Baixa o arquivo em blocos para um temporário na mesma pasta e só renomeia quando o download termina,
+    # assim a memória fica constante e nunca sobra um arquivo pela metade no destino.
+    # Se um hasher (hashlib) for passado ele é atualizado com cada bloco, sem reler o arquivo depois
+    directory = os.path.dirname(dest_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with session.get(url, stream=True, timeout=timeout, params=params, headers=headers) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        if hasher is not None:
+                            hasher.update(chunk)
+
+        if response.status_code == 304:
+            # Requisição condicional: o arquivo local continua válido
+            os.remove(tmp_path)
+            return response
+
+        os.chmod(tmp_path, 0o644)  # mkstemp cria o arquivo só com permissão do dono
+        os.replace(tmp_path, dest_path)  # Rename atômico no mesmo sistema de arquivos
+        return response
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def iter_tasks(session, url: str, project_id: int, page_size: int = 100, query=None, fields: str = 'all', timeout: int = 60):
+    # Percorre as tasks do projeto página por página pela API do data manager, sem carregar tudo de uma vez.
+    # O servidor pode limitar page_size, então uma página menor que a pedida não indica o fim: a listagem só termina
+    # no total informado pelo servidor, numa página vazia ou no 404. Se terminar antes do total, levanta erro
+    params = {'project': project_id, 'page_size': page_size, 'fields': fields}
+    if query is not None:
+        params['query'] = json.dumps(query)
+
+    page = 1
+    seen = 0
+    total = None
+    while True:
+        params['page'] = page
+        response = session.get(f'{url}/api/tasks/', params=params, timeout=timeout)
+        if response.status_code == 404:
+            break  # O Label Studio responde 404 quando a página passa do fim
+        response.raise_for_status()
+
+        data = response.json()
+        tasks = data.get('tasks', []) if isinstance(data, dict) else data
+        if isinstance(data, dict) and data.get('total') is not None:
+            total = data['total']
+        if not tasks:
+            break
+        yield from tasks
+
+        seen += len(tasks)
+        if total is not None and seen >= total:
+            return
+        page += 1
+
+    if total is not None and seen < total:
+        raise Exception(f'[iter_tasks] Listagem incompleta do projeto {project_id}: {seen} de {total} tasks')
@@ -0,0 +1,119 @@
+import struct
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_ORIENTATION = 0x0112
+# Marcadores SOF do JPEG (C4, C8 e CC têm outro significado)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Marcadores sem campo de tamanho
+STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+def exif_orientation(tiff):
+    # Lê a tag Orientation do IFD0 de um bloco EXIF (cabeçalho TIFF); 1 se não existir
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return 1
+    order = '<' if tiff[:2] == b'II' else '>'
+    offset = struct.unpack(order + 'I', tiff[4:8])[0]
+    if offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag = struct.unpack(order + 'H', tiff[entry:entry + 2])[0]
+        if tag == EXIF_ORIENTATION:
+            return struct.unpack(order + 'H', tiff[entry + 8:entry + 10])[0]
+    return 1
+
+
+def jpeg_size(f):
+    # Percorre os segmentos do JPEG até o SOF (largura/altura) sem ler os dados comprimidos.
+    # A orientação EXIF (APP1) vem antes do SOF e troca largura e altura como o cv2.imread faz
+    if f.read(2) != b'\xff\xd8':
+        return None
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            return None  # Fim da imagem ou início dos dados sem ter achado o SOF
+
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            if not width or not height:
+                return None  # Altura definida depois (DNL): só decodificando
+            return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        if marker == 0xE1:
+            data = f.read(length - 2)
+            if data[:6] == b'Exif\x00\x00':
+                orientation = exif_orientation(data[6:])
+        else:
+            f.seek(length - 2, 1)
+
+
+def png_size(f):
+    # Largura/altura ficam no chunk IHDR, logo depois da assinatura
+    header = f.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def header_size(path):
+    try:
+        with open(path, 'rb') as f:
+            start = f.read(8)
+            f.seek(0)
+            if start[:2] == b'\xff\xd8':
+                return jpeg_size(f)
+            if start == PNG_SIGNATURE:
+                return png_size(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def pil_size(path):
+    # Abertura preguiçosa do PIL: lê só o cabeçalho, sem decodificar os pixels
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            if img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+        return width, height
+    except Exception:
+        return None
+
+
+def decoded_size(path):
+    # Último recurso: decodifica a imagem inteira
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    return w, h
+
+
+def probe_size(path):
+    # (largura, altura) da imagem pelo cabeçalho JPEG/PNG, depois pelo PIL e só então decodificando;
+    # (None, None) se a imagem não puder ser lida
+    return header_size(path) or pil_size(path) or decoded_size(path) or (None, None)
+
+
+def probe_sizes(paths, workers=8):
+    # probe_size de várias imagens em paralelo, na ordem de paths
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(probe_size, paths))
@@ -0,0 +1,126 @@
+import os
+import json
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from Http_session import build_session, stream_download, iter_tasks
+from Download_manifest import DownloadManifest
+from Unpack_zip import UnpackZip
+
+class IncrementalExport:
+    def __init__(self, url: str, api_key: str, project_id: int, output_dir: str, session=None,
+                 batch_size: int = 500, safety_margin_minutes: int = 5):
+        self.url = url  # URL do Label Studio
+        self.api_key = api_key  # Token de autenticação
+        self.project_id = project_id  # ID do projeto
+        self.output_dir = output_dir  # Pasta Dataset_<nome>_<id> já exportada
+        self.session = session or build_session(self.api_key)
+        self.batch_size = batch_size  # Máximo de tasks por exportação parcial (limita o tamanho da URL)
+        # Volta um pouco no tempo em cada sincronização para não perder tasks por diferença de relógio
+        self.safety_margin = timedelta(minutes=safety_margin_minutes)
+        self.state_path = os.path.join(self.output_dir, 'sync_state.json')
+
+    def has_state(self):
+        # Só dá pra exportar incrementalmente se já houve uma exportação registrada
+        return os.path.exists(self.state_path)
+
+    def load_state(self):
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_state(self, sync_time):
+        # Registra o ponto de sincronização (horário UTC em que a exportação começou)
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({'project_id': self.project_id, 'last_sync': sync_time.isoformat()}, f, indent=4)
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc)
+
+    def changed_tasks(self, since):
+        # Tasks criadas, alteradas ou anotadas depois do último ponto de sincronização
+        query = {'filters': {'conjunction': 'or', 'items': [
+            {'filter': 'filter:tasks:updated_at', 'operator': 'greater', 'type': 'Datetime', 'value': since},
+            {'filter': 'filter:tasks:completed_at', 'operator': 'greater', 'type': 'Datetime', 'value': since}
+        ]}}
+        return list(iter_tasks(self.session, self.url, self.project_id, query=query))
+
+    def current_task_ids(self):
+        # Só os IDs de todas as tasks atuais, para descobrir quais foram removidas do projeto
+        return {task['id'] for task in iter_tasks(self.session, self.url, self.project_id, page_size=1000,
+                                                  fields='task_only')}
+
+    def remove_files(self, image_filename):
+        # Remove a imagem e a label de uma task, esteja ela em images/labels ou já em um split
+        stem = Path(image_filename).stem
+        removed = False
+        for folder in ('', 'train', 'val', 'test'):
+            for path in (os.path.join(self.output_dir, 'images', folder, image_filename),
+                         os.path.join(self.output_dir, 'labels', folder, stem + '.txt')):
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed = True
+        return removed
+
+    def export_labels(self, task_ids):
+        # Exporta em YOLO só as tasks alteradas, em lotes, e extrai por cima do dataset existente
+        task_ids = sorted(task_ids)
+        for start in range(0, len(task_ids), self.batch_size):
+            batch = task_ids[start:start + self.batch_size]
+            zip_path = os.path.join(self.output_dir, f'incremental-{self.project_id}-{start}.zip')
+            stream_download(self.session, f'{self.url}/api/projects/{self.project_id}/export', zip_path,
+                            timeout=600, params={'exportType': 'YOLO', 'ids[]': batch})
+            try:
+                UnpackZip(zip_path=zip_path, extract_to=self.output_dir).extract()
+            finally:
+                os.remove(zip_path)
+
+    def run(self, downloader, converter=None):
+        # Sincroniza o dataset com o projeto: remove tasks apagadas, atualiza labels e baixa imagens novas/alteradas.
+        # Depois disso o DataOrganizer divide as novas e mantém as alteradas no split onde já estavam.
+        # Com um YoloConverter as labels são geradas localmente em vez de exportadas pelo servidor
+        sync_time = self.now()
+        since = (datetime.fromisoformat(self.load_state()['last_sync']) - self.safety_margin).isoformat()
+        manifest = DownloadManifest(self.output_dir)
+        print(f"[INFO] Exportação incremental do projeto {self.project_id} desde {since}")
+
+        # Tasks removidas do projeto
+        current_ids = self.current_task_ids()
+        deleted = [task_id for task_id in list(manifest.entries) if int(task_id) not in current_ids]
+        for task_id in deleted:
+            entry = manifest.remove(task_id)
+            self.remove_files(entry['filename'])
+        manifest.save()
+        print(f"[INFO] {len(deleted)} tasks removidas do dataset")
+
+        # Tasks novas ou alteradas: a label antiga sai antes, caso a task não tenha mais anotação
+        tasks = self.changed_tasks(since)
+        print(f"[INFO] {len(tasks)} tasks novas ou alteradas")
+        if tasks:
+            for task in tasks:
+                _, image_filename = downloader.task_image(task)
+                entry = manifest.get(task['id'])
+                if entry and entry['filename'] != image_filename:
+                    self.remove_files(entry['filename'])  # A task trocou de imagem
+                if image_filename:
+                    stem = Path(image_filename).stem
+                    for folder in ('', 'train', 'val', 'test'):
+                        label_path = os.path.join(self.output_dir, 'labels', folder, stem + '.txt')
+                        if os.path.exists(label_path):
+                            os.remove(label_path)
+
+            if converter is None:
+                self.export_labels([task['id'] for task in tasks])
+                summary = downloader.download_images(tasks=tasks)
+            else:
+                summary = downloader.download_images(tasks=tasks, on_task=converter.convert_task)
+                converter.write_metadata()
+        else:
+            summary = {'downloaded': 0, 'cached': 0, 'skipped': 0, 'failed': [], 'error': None}
+
+        # Com falhas ou com o download interrompido o ponto de sincronização não avança,
+        # assim a próxima execução tenta essas tasks de novo
+        if not summary['failed'] and not summary['error']:
+            self.save_state(sync_time)
+        summary['deleted'] = len(deleted)
+        return summary
@@ -0,0 +1,167 @@
+import math
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from label_studio_sdk import Client
+from Http_session import build_adapter, build_session, iter_tasks
+
+class LabelStudioClient:
+    def __init__(self, url: str, api_key: str, pool_size: int = 16, retries: int = 3, backoff_factor: float = 0.5,
+                 cache_ttl: float = 300, page_size: int = 100):
+        # Cliente único do Label Studio: uma sessão com pool de conexões para todas as chamadas REST e para o SDK,
+        # com cache (TTL) de metadados que não mudam durante uma exportação
+        self.url = url  # URL do Label Studio
+        self.api_key = api_key  # Token de autenticação
+        self.cache_ttl = cache_ttl  # Segundos que um resultado fica no cache
+        self.page_size = page_size  # Projetos por página na listagem
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session = build_session(api_key, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+        self.cache = {}  # chave -> (expira_em, valor)
+        self.lock = threading.Lock()
+        self.sdk_client = None
+
+    def ensure_pool_size(self, pool_size):
+        # Aumenta o pool de conexões da sessão (nunca diminui), ex: antes de vários downloads em paralelo.
+        # Deve ser chamado antes de as threads começarem a usar a sessão
+        if pool_size <= self.pool_size:
+            return
+        adapter = build_adapter(pool_size, self.retries, self.backoff_factor)
+        old = self.session.get_adapter('https://')
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        old.close()
+        self.pool_size = pool_size
+
+    @property
+    def sdk(self):
+        # Cliente do SDK criado uma vez só e usando a mesma sessão
+        with self.lock:
+            if self.sdk_client is None:
+                self.sdk_client = Client(url=self.url, api_key=self.api_key, session=self.session)
+            return self.sdk_client
+
+    def cached(self, key, loader):
+        # Retorna o valor do cache se ainda não expirou, senão chama loader e guarda o resultado
+        now = time.monotonic()
+        with self.lock:
+            hit = self.cache.get(key)
+            if hit and hit[0] > now:
+                return hit[1]
+        value = loader()
+        with self.lock:
+            self.cache[key] = (now + self.cache_ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        # Limpa uma entrada do cache, ou todo o cache
+        with self.lock:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+    def get_json(self, path, params=None):
+        response = self.session.get(f'{self.url}{path}', params=params, timeout=60)
+        if response.status_code != 200:
+            raise Exception(f'[LabelStudioClient] Erro {response.status_code} em GET {path}')
+        return response.json()
+
+    def check_connection(self):
+        # Só cacheia conexões bem-sucedidas, para uma falha poder ser testada de novo
+        key = ('connection',)
+        with self.lock:
+            hit = self.cache.get(key)
+            if hit and hit[0] > time.monotonic():
+                return True
+        try:
+            ok = self.get_json('/health').get('status') == 'UP'
+        except Exception:
+            ok = False
+        if ok:
+            with self.lock:
+                self.cache[key] = (time.monotonic() + self.cache_ttl, True)
+        return ok
+
+    def get_project_info(self, project_id):
+        return self.cached(('project_info', project_id), lambda: self.get_json(f'/api/projects/{project_id}'))
+
+    def get_project(self, project_id):
+        # Objeto Project do SDK, reutilizado entre exportador e downloader
+        return self.cached(('project', project_id), lambda: self.sdk.get_project(project_id))
+
+    def projects_page(self, page):
+        data = self.get_json('/api/projects/', params={'page': page, 'page_size': self.page_size})
+        if not isinstance(data, dict) or "results" not in data:
+            raise Exception("[LabelStudioClient] Estrutura inesperada. Esperado dict com chave 'results'!")
+        return data
+
+    def list_projects(self):
+        return self.cached(('projects',), self.fetch_projects)
+
+    def fetch_projects(self):
+        # Busca a primeira página e, se o servidor informar o total, as demais em paralelo.
+        # Sem o total segue os links 'next' um por um
+        first = self.projects_page(1)
+        projects = list(first['results'])
+        count = first.get('count')
+
+        if count is not None and first.get('next'):
+            pages = range(2, math.ceil(count / self.page_size) + 1)
+            with ThreadPoolExecutor(max_workers=min(len(pages), self.pool_size) or 1) as executor:
+                for data in executor.map(self.projects_page, pages):
+                    projects.extend(data['results'])
+            return projects
+
+        next_url = first.get('next')
+        while next_url:
+            response = self.session.get(next_url, timeout=60)
+            if response.status_code != 200:
+                raise Exception('[LabelStudioClient] Erro ao buscar os projetos')
+            data = response.json()
+            projects.extend(data.get('results', []))
+            next_url = data.get('next')
+        return projects
+
+    def iter_tasks(self, project_id, page_size=100, query=None, fields='all'):
+        return iter_tasks(self.session, self.url, project_id, page_size=page_size, query=query, fields=fields)
+
+
+class AsyncLabelStudioClient:
+    def __init__(self, client: LabelStudioClient):
+        # Variante asyncio do cliente: as chamadas rodam em threads (asyncio.to_thread) sobre a mesma sessão
+        # e o mesmo cache, então várias requisições podem ser aguardadas juntas com asyncio.gather
+        self.client = client
+
+    async def check_connection(self):
+        return await asyncio.to_thread(self.client.check_connection)
+
+    async def get_project_info(self, project_id):
+        return await asyncio.to_thread(self.client.get_project_info, project_id)
+
+    async def get_projects_info(self, project_ids):
+        return await asyncio.gather(*(self.get_project_info(project_id) for project_id in project_ids))
+
+    async def list_projects(self):
+        key = ('projects',)
+        with self.client.lock:
+            hit = self.client.cache.get(key)
+            if hit and hit[0] > time.monotonic():
+                return hit[1]
+
+        first = await asyncio.to_thread(self.client.projects_page, 1)
+        projects = list(first['results'])
+        count = first.get('count')
+        if count is not None and first.get('next'):
+            pages = range(2, math.ceil(count / self.client.page_size) + 1)
+            results = await asyncio.gather(*(asyncio.to_thread(self.client.projects_page, p) for p in pages))
+            for data in results:
+                projects.extend(data['results'])
+        elif first.get('next'):
+            projects = await asyncio.to_thread(self.client.fetch_projects)
+
+        with self.client.lock:
+            self.client.cache[key] = (time.monotonic() + self.client.cache_ttl, projects)
+        return projects
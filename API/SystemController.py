@@ -1,90 +1,174 @@
 import os
-import requests
 import glob
 from Export_images import ExportImages
 from Export_zip import ExportZipProject
 from Unpack_zip import UnpackZip
+from Incremental_export import IncrementalExport
+from Export_pipeline import ExportPipeline
+from Yolo_converter import YoloConverter
+from Blob_store import BlobStore
+from LabelStudio_client import LabelStudioClient
 from Dataset_organization import DataOrganizer
 from Dataset_Concatenator import DatasetConcatenator
+from Dataset_registry import DatasetRegistry
 from Filters_treatment import DatasetFilter
 
 class SystemController:
-    def __init__(self, api_key: str, url: str = ''):
+    def __init__(self, api_key: str, url: str = '', blob_store_dir: str = None):
         self.api_key = api_key
         self.url = url
+        # Com blob_store_dir as imagens de downloads e concatenações são guardadas uma vez só, por hash
+        self.blob_store = BlobStore(blob_store_dir) if blob_store_dir else None
+        # Cliente único com pool de conexões e cache de metadados, usado por todos os exportadores
+        self.client = LabelStudioClient(self.url, self.api_key)
+        # Registro (SQLite) dos datasets exportados e concatenados, usado nas buscas por ID
+        self.registry = DatasetRegistry()
         print(f"[INFO] Inicializando com URL definida")
 
     def list_projects(self):
-        headers = {"Authorization": f"Token {self.api_key}"}
-        url = f"{self.url}/api/projects/"
-        all_projects = []
-        while url:
-            response = requests.get(f"{self.url}/api/projects/", headers=headers)
-
-            print("[INFO] Requisição enviada para listar projetos")
-
-            if response.status_code != 200:
-                print("[ERRO] Erro ao buscar projetos")
-                raise Exception('[SystemController] Erro ao buscar os projetos')
-
-            projects = response.json()
-
-            if not isinstance(projects, dict) or "results" not in projects:
-                print("[ERRO] Estrutura inesperada ao buscar projetos")
-                raise Exception("[SystemController] Estrutura inesperada. Esperado dict com chave 'results'!")
-
-            all_projects.extend(project["results"])  # Junta os resultados
-            
-            url = project.get("next")
-            
-            print("[INFO] Projetos listados com sucesso ou nenhum ID foi digitado")
-            for project in all_projects:
-                print(f"ID: {project['id']} | Nome: {project['title']}")
+        print("[INFO] Requisição enviada para listar projetos")
+        try:
+            all_projects = self.client.list_projects()  # Segue a paginação, buscando as páginas em paralelo
+        except Exception as e:
+            print("[ERRO] Erro ao buscar projetos")
+            raise Exception(f'[SystemController] Erro ao buscar os projetos: {e}')
+
+        print("[INFO] Projetos listados com sucesso ou nenhum ID foi digitado")
+        for project in all_projects:
+            print(f"ID: {project['id']} | Nome: {project['title']}")
         return all_projects
 
-    def start_exportation(self, selected_ids, auto_concatenate=False):
-        exported_ids = []
+    # Quantos projetos podem estar ao mesmo tempo em cada etapa da exportação
+    DEFAULT_STAGE_WORKERS = {'export': 2, 'unpack': 2, 'download': 2, 'split': 2}
+    # Conexões do pool reservadas às chamadas REST (exportação, listagem de tasks) além das dos downloads
+    REST_CONNECTIONS = 8
 
-        for project_id in selected_ids:
-            print(f"[INFO] Iniciando exportação do projeto {project_id}")
-            try:
-                # Salva o dataset extraído com o nome do projeto original
-                project_info = self.get_project_info(project_id)
-                project_name = project_info['title'].replace(" ", "_").replace("/", "_")
-                self.output_dir = f'Dataset_{project_name}_{project_id}'
+    def export_stage(self, context):
+        # Prepara o projeto e pede a exportação YOLO ao servidor (a parte que só depende do Label Studio)
+        project_id = context['project_id']
+        print(f"[INFO] Iniciando exportação do projeto {project_id}")
 
-                # Inicializa exportador e downloader
-                exporter = ExportZipProject(self.url, self.api_key, project_id)
-                downloader = ExportImages(self.url, self.api_key, project_id, self.output_dir)
+        # Salva o dataset extraído com o nome do projeto original
+        project_info = self.get_project_info(project_id)
+        project_name = project_info['title'].replace(" ", "_").replace("/", "_")
+        output_dir = f'Dataset_{project_name}_{project_id}'
+        context['output_dir'] = output_dir
+        context['project_info'] = project_info
 
-                # Exporta os dados do projeto como ZIP
-                export_data = exporter.export_project()
+        # Inicializa exportador e downloader
+        exporter = ExportZipProject(self.url, self.api_key, project_id, client=self.client)
+        downloader = ExportImages(self.url, self.api_key, project_id, output_dir,
+                                  workers=context['download_workers'], blob_store=self.blob_store,
+                                  client=self.client)
+        incremental_export = IncrementalExport(self.url, self.api_key, project_id, output_dir,
+                                               session=self.client.session)
+        context['downloader'] = downloader
+        context['incremental_export'] = incremental_export
 
-                # Verifica se o ZIP foi salvo corretamente
-                if isinstance(export_data, str) and export_data.endswith('.zip') and os.path.exists(export_data):
-                    zip_file = export_data
-                else:
-                    print("[AVISO] Caminho ZIP inválido ou não encontrado, tentando localizar arquivo mais recente...")
-                    zip_file = self.search_zip_file()
+        # No modo incremental a exportação parcial é feita junto com o download
+        context['use_incremental'] = context['incremental'] and incremental_export.has_state()
+        if context['use_incremental']:
+            return
+
+        context['sync_time'] = IncrementalExport.now()
 
-                # Descompacta o ZIP baixado
-                extractor = UnpackZip(zip_path=zip_file, extract_to=self.output_dir)
-                extractor.extract()
+        # No modo local as labels são convertidas das tasks durante o download, sem ZIP do servidor
+        if context['export_mode'] == 'local':
+            return
 
-                # Verifica conexão e baixa imagens
-                downloader.check_connection()
-                downloader.download_images()
+        # Exporta os dados do projeto como ZIP
+        export_data = exporter.export_project()
 
-                # Divide dataset em treino, validação e teste
-                splitter = DataOrganizer(dataset_dir=self.output_dir)
-                splitter.start_split()
+        # Verifica se o ZIP foi salvo corretamente. Só o caminho devolvido pela exportação é usado: outro .zip da
+        # pasta pode ser de outro projeto
+        if not (isinstance(export_data, str) and export_data.endswith('.zip') and os.path.exists(export_data)):
+            raise FileNotFoundError(f'[SystemController] ZIP da exportação do projeto {project_id} não encontrado: '
+                                    f'{export_data}')
+        context['zip_file'] = export_data
 
-                print(f'[OK] Exportação do projeto {project_id} concluída')
-                exported_ids.append(project_id)
+    def unpack_stage(self, context):
+        # Descompacta o ZIP baixado
+        if context['use_incremental'] or context['export_mode'] == 'local':
+            return
+        extractor = UnpackZip(zip_path=context['zip_file'], extract_to=context['output_dir'])
+        if context['direct_split']:
+            # Cada arquivo vai direto para o split final e as imagens são baixadas no mesmo lugar
+            splitter = DataOrganizer(dataset_dir=context['output_dir'])
+            context['split_assignment'] = extractor.extract_to_splits(splitter.build_assignment)
+            splitter.create_folders()
+        else:
+            extractor.extract()
+
+    def download_stage(self, context):
+        # Verifica conexão e baixa imagens
+        downloader = context['downloader']
+        incremental_export = context['incremental_export']
+        downloader.check_connection()
+
+        converter = None
+        if context['export_mode'] == 'local':
+            converter = YoloConverter.from_project_info(context['project_info'], context['output_dir'])
+
+        if context['use_incremental']:
+            # Só busca o que mudou desde a última exportação do projeto
+            summary = incremental_export.run(downloader, converter=converter)
+            if summary['error']:
+                raise RuntimeError(f"Download interrompido: {summary['error']}")
+            return
+
+        if converter is None:
+            summary = downloader.download_images(split_assignment=context.get('split_assignment'))
+        else:
+            # Cada página de tasks alimenta a conversão das labels e os downloads ao mesmo tempo
+            summary = downloader.download_images(on_task=converter.convert_task)
+            converter.write_metadata()
+
+        # Download interrompido: o projeto falha no pipeline e o ponto de sincronização não é marcado
+        if summary['error']:
+            raise RuntimeError(f"Download interrompido: {summary['error']}")
+
+        # Marca o ponto de sincronização para as próximas exportações incrementais
+        if not summary['failed']:
+            incremental_export.save_state(context['sync_time'])
+
+    def split_stage(self, context):
+        # Divide dataset em treino, validação e teste (já feito na extração quando direct_split está ativo)
+        if context.get('split_assignment') is not None:
+            splitter = DataOrganizer(dataset_dir=context['output_dir'])
+            splitter.save_manifest(splitter.current_split_files())  # Registra o split feito na extração
+            self.registry.register_project(context['project_id'], context['output_dir'],
+                                           name=context['project_info']['title'])
+            print(f"[OK] Exportação do projeto {context['project_id']} concluída")
+            return
+        splitter = DataOrganizer(dataset_dir=context['output_dir'])
+        splitter.start_split()
+        self.registry.register_project(context['project_id'], context['output_dir'],
+                                       name=context['project_info']['title'])
+        print(f"[OK] Exportação do projeto {context['project_id']} concluída")
+
+    def start_exportation(self, selected_ids, auto_concatenate=False, download_workers=8, incremental=False,
+                          stage_workers=None, export_mode='server', direct_split=False):
+        # Os projetos passam pelas etapas export -> unpack -> download -> split em pipeline: enquanto um projeto
+        # baixa imagens, outro já está sendo exportado no servidor e outro sendo dividido.
+        # export_mode='local' converte as labels YOLO a partir das tasks em vez de usar o ZIP do servidor.
+        # direct_split extrai o ZIP e baixa as imagens direto em train/val/test, sem mover arquivos depois
+        if export_mode not in ('server', 'local'):
+            raise ValueError(f"[SystemController] Modo de exportação inválido: {export_mode}")
+        stage_workers = {**self.DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+        # Todos os projetos na etapa de download usam a mesma sessão: o pool precisa de uma conexão por thread
+        # de download, senão as threads ficam esperando conexão livre (pool_block)
+        self.client.ensure_pool_size(download_workers * max(1, stage_workers['download']) + self.REST_CONNECTIONS)
+        pipeline = ExportPipeline(
+            stages=[('export', self.export_stage), ('unpack', self.unpack_stage),
+                    ('download', self.download_stage), ('split', self.split_stage)],
+            concurrency=stage_workers
+        )
+        contexts = {project_id: {'project_id': project_id, 'incremental': incremental,
+                                 'download_workers': download_workers, 'export_mode': export_mode,
+                                 'direct_split': direct_split}
+                    for project_id in dict.fromkeys(selected_ids)}
+        exported_ids = pipeline.run(contexts)
 
-            except Exception as e:
-                print(f'[ERRO] Falha ao exportar o projeto {project_id}: {e}')
-            
         if not exported_ids:
             print("[ERRO] Nenhum projeto foi exportado com sucesso")
             return
@@ -96,7 +180,9 @@ class SystemController:
                 concatenator = DatasetConcatenator(
                     project_ids=exported_ids,
                     output_dir='Dataset_concatenado',
-                    final_project_name='Dataset'
+                    final_project_name='Dataset',
+                    blob_store=self.blob_store,
+                    registry=self.registry
                 )
                 path = concatenator.concatenate()
                 print(f'\n[OK] Dataset concatenado salvo em: {path}')
@@ -119,15 +205,30 @@ class SystemController:
             else:
                 print("Entrada inválida. Digite apenas um número ou 'q' para sair")
 
-        if not ids_to_concat:
+        # Um dataset já concatenado só recebe os projetos novos e o que mudou nos que já tinha
+        existing = input("Caminho de um dataset concatenado para atualizar (ENTER para criar um novo): ").strip()
+        if existing and not os.path.exists(os.path.join(existing, DatasetConcatenator.MANIFEST_NAME)):
+            print("[ERRO] Dataset sem manifesto de concatenação, não pode ser atualizado")
+            return
+
+        if not ids_to_concat and not existing:
             print("[ERRO] Nenhum ID válido informado")
             return
+
+        virtual = False
+        if not existing:
+            res = input("Criar dataset virtual (só listas de imagens e data.yaml, sem copiar)? (s/n): ").strip().lower()
+            virtual = True if res == 's' else False
         try:
             # Cria concatenador com os IDs digitados
             concatenator = DatasetConcatenator(
                 project_ids=ids_to_concat,
                 output_dir='Dataset_concatenado',
-                final_project_name='Dataset'
+                final_project_name='Dataset',
+                blob_store=self.blob_store,
+                virtual=virtual,
+                existing_dataset=existing or None,
+                registry=self.registry
             )
             path = concatenator.concatenate()
             print(f'\n[OK] Dataset concatenado salvo em: {path}')
@@ -135,23 +236,12 @@ class SystemController:
             print(f"[ERRO] Erro ao concatenar: {e}")
 
     def get_project_info(self, project_id):
-        headers = {"Authorization": f"Token {self.api_key}"}
-        response = requests.get(f"{self.url}/api/projects/{project_id}", headers=headers)
-        if response.status_code != 200:
+        try:
+            return self.client.get_project_info(project_id)  # Resultado fica em cache pelo TTL do cliente
+        except Exception:
             print(f"[ERRO] Falha ao obter informações do projeto {project_id}")
             raise Exception(f'[SystemController] Não foi possível obter as informações do projeto {project_id}')
-        return response.json()
-
-    def search_zip_file(self):  # Só acontece se exportação falhar em retornar o caminho certo do zip 
-        # Busca o .zip mais recente no diretório atual
-        zip_files = [f for f in os.listdir('.') if f.endswith('.zip')]
-        if not zip_files:
-            print("[ERRO] Nenhum arquivo .zip encontrado no diretório atual")
-            raise FileNotFoundError('[SystemController] Nenhum arquivo .zip encontrado no diretório atual')
-        latest_zip = max(zip_files, key=os.path.getmtime)
-        print(f"[INFO] ZIP mais recente localizado: {latest_zip}")
-        return latest_zip
-    
+
     def run_dataset_filter_menu(self):
         try:
             print("\nDigite o ID do dataset extraído (ex: 60 ou 60_61):")
@@ -161,7 +251,8 @@ class SystemController:
                 print("ID inválido. Digite apenas números ou números separados por underline (ex: 60 ou 60_61).")
                 return
 
-            filtro = DatasetFilter(dataset_id, base_path=os.getcwd())
+            filtro = DatasetFilter(dataset_id, base_path=os.getcwd(), blob_store=self.blob_store,
+                                   registry=self.registry)
             print(f"Dataset encontrado: {filtro.dataset_path}")
             filtro.run_menu()
 
@@ -193,7 +284,12 @@ if __name__ == "__main__":
 
             res = input("Deseja concatenar os projetos após a extração? (s/n): ").strip().lower()
             auto_concat = True if res == 's' else False
-            controller.start_exportation(selected_ids, auto_concatenate=auto_concat)
+            res = input("Exportar só o que mudou desde a última exportação (incremental)? (s/n): ").strip().lower()
+            incremental = True if res == 's' else False
+            res = input("Converter as labels localmente, sem gerar o ZIP no servidor? (s/n): ").strip().lower()
+            export_mode = 'local' if res == 's' else 'server'
+            controller.start_exportation(selected_ids, auto_concatenate=auto_concat, incremental=incremental,
+                                         export_mode=export_mode)
 
         elif op == '2':
             controller.concatenate_datasets()
@@ -1,5 +1,8 @@
+import io
 import os
+import shutil
 import zipfile
+from pathlib import Path
 
 class UnpackZip:
     def __init__(self, zip_path: str, extract_to: str = 'Dataset'):
@@ -25,3 +28,72 @@ class UnpackZip:
         except Exception as e:
             print(f"[UnpackZip] Erro ao descompactar: {e}")
             raise
+
+    @staticmethod
+    def is_empty_label(zip_ref, info):
+        # Tamanho 0 (pelo índice do ZIP) é vazio; senão lê em blocos só até o primeiro caractere que não é espaço,
+        # que numa label com anotações já está no primeiro bloco
+        if info.file_size == 0:
+            return True
+        with io.TextIOWrapper(zip_ref.open(info), encoding='utf-8', errors='replace') as f:
+            for chunk in iter(lambda: f.read(4096), ''):
+                if chunk.strip():
+                    return False
+        return True
+
+    def extract_to_splits(self, assign_splits):
+        # Extrai cada arquivo direto para o destino final (images/<split> ou labels/<split>), sem passar pela
+        # pasta images/labels e sem o DataOrganizer precisar mover nada depois.
+        # assign_splits(nomes, read_label) recebe os nomes (sem extensão) das labels não vazias e uma função que
+        # lê o texto de uma label do ZIP, e retorna {nome: split}.
+        # Retorna esse mapa para o download das imagens usar o mesmo split
+        if not os.path.exists(self.zip_path):
+            raise FileNotFoundError(f'[UnpackZip] Arquivo ZIP não encontrado: {self.zip_path}')
+
+        os.makedirs(self.extract_to, exist_ok=True)
+        print(f"[UnpackZip] Descompactando {self.zip_path} direto nos splits de {self.extract_to}...")
+
+        try:
+            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
+                members = [info for info in zip_ref.infolist() if not info.is_dir()]
+
+                # Filtra as labels vazias pelo índice do ZIP, antes de escrever qualquer arquivo
+                label_members = {}
+                empty = 0
+                for info in members:
+                    parts = Path(info.filename).parts
+                    if len(parts) == 2 and parts[0] == 'labels' and parts[1].endswith('.txt'):
+                        if self.is_empty_label(zip_ref, info):
+                            empty += 1
+                        else:
+                            label_members[Path(parts[1]).stem] = info
+
+                def read_label(stem):
+                    return zip_ref.read(label_members[stem]).decode('utf-8')
+
+                assignment = assign_splits(list(label_members), read_label)
+
+                written = 0
+                for info in members:
+                    parts = Path(info.filename).parts
+                    if len(parts) == 1:
+                        dest = os.path.join(self.extract_to, parts[0])  # classes.txt, notes.json
+                    elif len(parts) == 2 and parts[0] in ('images', 'labels'):
+                        subset = assignment.get(Path(parts[1]).stem)
+                        if subset is None:
+                            continue  # Label vazia ou imagem sem label: não é escrita
+                        dest = os.path.join(self.extract_to, parts[0], subset, parts[1])
+                    else:
+                        continue
+
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    with zip_ref.open(info) as src, open(dest, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)  # Copia em blocos, sem carregar o arquivo todo
+                    written += 1
+
+            print(f"[UnpackZip] Descompactação concluída: {written} arquivos escritos, {empty} labels vazias ignoradas")
+            return assignment
+
+        except Exception as e:
+            print(f"[UnpackZip] Erro ao descompactar: {e}")
+            raise
@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+class YoloConverter:
+    def __init__(self, output_dir, classes):
+        self.output_dir = output_dir  # Pasta do dataset
+        self.labels_dir = os.path.join(output_dir, 'labels')  # Pasta onde as labels .txt são escritas
+        self.classes = classes  # Nomes das classes, na ordem dos IDs
+        self.class_ids = {name: idx for idx, name in enumerate(classes)}
+        self.converted = 0  # Tasks convertidas
+        self.lock = threading.Lock()
+        os.makedirs(self.labels_dir, exist_ok=True)
+
+    @classmethod
+    def from_project_info(cls, project_info, output_dir):
+        # Pega as classes das tags RectangleLabels da configuração do projeto, em ordem alfabética como
+        # o exportador YOLO do Label Studio faz
+        labels = set()
+        for control in (project_info.get('parsed_label_config') or {}).values():
+            if control.get('type', '').lower() == 'rectanglelabels':
+                labels.update(control.get('labels', []))
+        if not labels:
+            raise ValueError('[YoloConverter] O projeto não tem nenhuma tag RectangleLabels na configuração')
+        return cls(output_dir, sorted(labels))
+
+    @staticmethod
+    def select_annotation(task):
+        # Usa a última anotação não cancelada da task
+        annotations = [a for a in task.get('annotations') or [] if not a.get('was_cancelled')]
+        return annotations[-1] if annotations else None
+
+    def convert_task(self, task):
+        # Converte os retângulos da task para o formato YOLO (classe cx cy w h normalizados) e salva a label.
+        # Tasks sem anotação não geram label, igual à exportação do servidor
+        image_url = task['data'].get('image')
+        annotation = self.select_annotation(task)
+        if not image_url or annotation is None:
+            return False
+
+        lines = []
+        for result in annotation.get('result') or []:
+            if result.get('type', '').lower() != 'rectanglelabels':
+                continue
+            value = result['value']
+            for label in value.get('rectanglelabels', []):
+                class_id = self.class_ids.get(label)
+                if class_id is None:
+                    continue
+                x = (value['x'] + value['width'] / 2) / 100
+                y = (value['y'] + value['height'] / 2) / 100
+                w = value['width'] / 100
+                h = value['height'] / 100
+                lines.append(f"{class_id} {x} {y} {w} {h}\n")
+
+        label_path = os.path.join(self.labels_dir, Path(os.path.basename(image_url)).stem + '.txt')
+        with open(label_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+
+        with self.lock:
+            self.converted += 1
+        return True
+
+    def write_metadata(self):
+        # Escreve classes.txt e notes.json no mesmo formato do ZIP exportado pelo Label Studio
+        with open(os.path.join(self.output_dir, 'classes.txt'), 'w', encoding='utf-8') as f:
+            for name in self.classes:
+                f.write(name + '\n')
+
+        notes = {
+            "categories": [{"id": i, "name": name} for i, name in enumerate(self.classes)],
+            "info": {
+                "year": datetime.now().year,
+                "version": "1.0",
+                "contributor": "Label Studio"
+            }
+        }
+        with open(os.path.join(self.output_dir, 'notes.json'), 'w', encoding='utf-8') as f:
+            json.dump(notes, f, indent=2, ensure_ascii=False)
+
+        print(f"[INFO] {self.converted} labels YOLO convertidas localmente em: {self.labels_dir}")